@@ -1,10 +1,101 @@
 # Import python packages
+import calendar
+import fnmatch
+import hashlib
+import io
+import json
+import re
+import time
+import uuid
+import networkx as nx
 import streamlit as st
 import pandas as pd
 from snowflake.snowpark.context import get_active_session
+from snowflake.snowpark.exceptions import SnowparkSQLException
 
 session = get_active_session()
 
+# Comparison strategies chosen per table by the adaptive strategy selector
+STRATEGY_METADATA_COUNT = 'METADATA_COUNT'
+STRATEGY_FULL_MINUS = 'FULL_MINUS'
+STRATEGY_HASH_AGGREGATE = 'HASH_AGGREGATE'
+STRATEGY_BUCKETED_DIFF = 'BUCKETED_DIFF'
+STRATEGY_SAMPLING = 'SAMPLING'
+
+# User-facing comparison policies (label -> policy)
+COMPARISON_POLICIES = {
+    'Auto (cheapest sufficient)': 'AUTO',
+    'Auto with sampling (approximate)': 'AUTO_SAMPLING',
+    'Full MINUS only': 'FULL_MINUS_ONLY',
+}
+
+# Thresholds used by the strategy selector
+SMALL_TABLE_ROWS = 1_000_000
+LARGE_TABLE_ROWS = 1_000_000_000
+MINUS_TIME_BUDGET_SECONDS = 60
+DIFF_BUCKETS = 1024
+SAMPLE_TARGET_ROWS = 1_000_000
+HLL_RELATIVE_ERROR = 0.0162
+
+# Name under which strategy timings are kept in the job config table, so later sessions reuse them
+STRATEGY_TIMINGS_CONFIG_NAME = '__strategy_timings__'
+
+# Export settings
+EXPORT_FORMATS = ['PARQUET', 'CSV']
+EXPORT_BATCH_ROWS = 100_000
+EXPORT_MAX_FILE_SIZE = 256 * 1024 * 1024
+
+# Fixed layout of exported results, so appends to an existing results table always line up
+EXPORT_RESULT_COLUMNS = {
+    'source_schema': 'string',
+    'target_schema': 'string',
+    'table_name': 'string',
+    'status': 'string',
+    'data_match': 'boolean',
+    'count1': 'Int64',
+    'count2': 'Int64',
+    'rows_in_table1_not_in_table2': 'Int64',
+    'rows_in_table2_not_in_table1': 'Int64',
+    'estimated_shared_rows': 'Int64',
+    'approximate': 'boolean',
+    'strategy': 'string',
+    'strategy_reason': 'string',
+    'elapsed_seconds': 'Float64',
+    'notes': 'string'
+}
+
+# Incremental validation settings
+STRATEGY_INCREMENTAL = 'INCREMENTAL'
+OFFSET_FORMAT = 'YYYY-MM-DD HH24:MI:SS.FF9 TZH:TZM'
+
+# Diff materialization cache settings
+DIFF_CACHE_TTL_MINUTES = 60
+DIFF_PAGE_SIZE = 100
+
+# Minimum seconds between redraws of the live results table
+LIVE_REFRESH_SECONDS = 1.0
+
+# Timeout and cancellation settings (0 means no limit)
+DEFAULT_QUERY_TIMEOUT_SECONDS = 0
+DEFAULT_TABLE_TIMEOUT_SECONDS = 0
+QUERY_POLL_SECONDS = 0.5
+
+# Snowflake error codes of statements stopped by STATEMENT_TIMEOUT_IN_SECONDS or cancelled
+SQL_ERROR_STATEMENT_TIMEOUT = 630
+SQL_ERROR_STATEMENT_CANCELLED = 604
+
+# Column rules: scope, action and the default argument of each action
+COLUMN_RULE_SCOPES = ['GLOBAL', 'SCHEMA', 'TABLE']
+COLUMN_RULE_ACTIONS = ['EXCLUDE', 'ROUND', 'TRIM', 'UPPER', 'TO_STRING']
+COLUMN_RULE_DEFAULT_ARGUMENTS = {'ROUND': '2'}
+
+# Query planning: lookups every table comparison needs, batched per database
+PLAN_LOOKUP_KINDS = ['metadata', 'columns', 'keys']
+PLAN_MAX_CONCURRENCY = 4
+
+class ComparisonTimeout(Exception):
+    """Raised when a comparison query passes its per-query or per-table deadline"""
+
 def get_all_tables_in_schema(session, database, schema):
     """Get all tables in a given schema"""
     try:
@@ -88,33 +179,610 @@ def get_all_schemas(session, database):
         st.error(f"Error getting schemas from {database}: {str(e)}")
         return []
 
-def compare_table_data_minus(session, db1, schema1, db2, schema2, table_name):
+def start_run_control(session, run_key, db1, db2, heartbeat,
+                      query_timeout=DEFAULT_QUERY_TIMEOUT_SECONDS, table_timeout=DEFAULT_TABLE_TIMEOUT_SECONDS):
+    """
+    Register a comparison run so its queries can be timed out and cancelled
+    The statement timeout is also set on the session as a server-side guard
+    """
+    control = {
+        'run_key': run_key,
+        'db1': db1,
+        'db2': db2,
+        'heartbeat': heartbeat,
+        'query_timeout': query_timeout,
+        'table_timeout': table_timeout,
+        'table_deadline': None,
+        'inflight': {},
+        'running': [],
+        'pending': [],
+        'finished': [],
+        'plan': None,
+        'plan_cache': {},
+        'query_count': 0,
+        'naive_queries': 0,
+        'peak_concurrency': 0
+    }
+    st.session_state['run_control'] = control
+    if query_timeout:
+        try:
+            session.sql(f"ALTER SESSION SET STATEMENT_TIMEOUT_IN_SECONDS = {int(query_timeout)}").collect()
+        except Exception:
+            pass
+    return control
+
+def end_run_control(session):
+    """Forget the active run and restore the session statement timeout"""
+    control = st.session_state.pop('run_control', None)
+    if control is not None and control['query_timeout']:
+        try:
+            session.sql("ALTER SESSION UNSET STATEMENT_TIMEOUT_IN_SECONDS").collect()
+        except Exception:
+            pass
+    return control
+
+def mark_table_started(schema1, schema2, table_name):
+    """
+    Record a table the run started working on
+    Returns the table's deadline, or None without a per-table time limit
+    """
+    control = st.session_state.get('run_control')
+    if control is None:
+        return None
+    key = (schema1, schema2, table_name)
+    if key in control['pending']:
+        control['pending'].remove(key)
+    control['running'].append(key)
+    return time.time() + control['table_timeout'] if control['table_timeout'] else None
+
+def mark_table_finished(result):
+    """Record a finished table result of the active run"""
+    control = st.session_state.get('run_control')
+    if control is None:
+        return
+    control['finished'].append(result)
+    control['naive_queries'] += get_naive_query_count(result['status'])
+    key = (result['source_schema'], result['target_schema'], result['table_name'])
+    if key in control['running']:
+        control['running'].remove(key)
+
+def get_error_status(e):
+    """
+    Map an exception raised during a comparison to a result status
+    Only the exception type and Snowflake error code count; messages can name tables or columns
+    """
+    if isinstance(e, ComparisonTimeout):
+        return 'TIMEOUT'
+    if isinstance(e, SnowparkSQLException):
+        if e.sql_error_code == SQL_ERROR_STATEMENT_TIMEOUT:
+            return 'TIMEOUT'
+        if e.sql_error_code == SQL_ERROR_STATEMENT_CANCELLED:
+            return 'CANCELLED'
+    return 'ERROR'
+
+def build_status_result(schema1, schema2, table_name, status, error=None):
+    """Build the result of a table that could not be compared"""
+    result = {
+        'source_schema': schema1,
+        'target_schema': schema2,
+        'table_name': table_name,
+        'count1': 'N/A',
+        'count2': 'N/A',
+        'rows_in_table1_not_in_table2': 'N/A',
+        'rows_in_table2_not_in_table1': 'N/A',
+        'data_match': False,
+        'status': status
+    }
+    if error is not None:
+        result['error'] = error
+    return result
+
+def run_query(session, query, result_type='row'):
+    """
+    Run a comparison query asynchronously so it can be timed out or cancelled
+    Outside an active run this behaves like a plain collect() / to_pandas()
+    """
+    control = st.session_state.get('run_control')
+    job = session.sql(query).collect_nowait()
+    if control is None:
+        return job.result(result_type)
+
+    started = time.time()
+    deadlines = [control['table_deadline']]
+    if control['query_timeout']:
+        deadlines.append(started + control['query_timeout'])
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    deadline = min(deadlines) if deadlines else None
+
+    control['inflight'][job.query_id] = started
+    control['query_count'] += 1
+    finished = False
+    try:
+        while not job.is_done():
+            if deadline is not None and time.time() > deadline:
+                raise ComparisonTimeout(f"Query {job.query_id} passed its time limit after {time.time() - started:.0f}s")
+            # Updating an element lets Streamlit interrupt this run when Stop is clicked
+            control['heartbeat'].caption(f"⏱️ Query {job.query_id} running for {time.time() - started:.0f}s")
+            time.sleep(QUERY_POLL_SECONDS)
+        finished = True
+        return job.result(result_type)
+    finally:
+        # Timed out or interrupted: do not leave the query holding the warehouse
+        if not finished:
+            try:
+                job.cancel()
+            except Exception:
+                pass
+        control['inflight'].pop(job.query_id, None)
+
+def get_plan_result(kind, database, schema):
+    """Get a lookup prefetched by the query plan of the active run, or None if it was not planned"""
+    control = st.session_state.get('run_control')
+    if control is None:
+        return None
+    return control['plan_cache'].get((kind, database, schema))
+
+def get_naive_query_count(status):
     """
-    Compare data between two tables using MINUS operation
+    Get the queries the original per-table sequence issues for a table with this outcome
+    That sequence is an existence COUNT, then the column list, both COUNTs and, when the counts
+    agree, both MINUS queries; a table missing from the target gets one more COUNT instead.
+    Tables that failed are counted for their existence check only, since where they stopped is unknown.
+    """
+    if status == 'ONLY_IN_SOURCE':
+        return 2
+    if status == 'COUNT_MISMATCH':
+        return 4
+    if status in ('MATCH', 'MISMATCH', 'SAMPLED_MATCH'):
+        return 6
+    return 1
+
+def get_plan_stats(control):
+    """Compare the queries a run issued with the queries of the original per-table sequence"""
+    if control is None or control['plan'] is None:
+        return None
+    plan = control['plan']
+    kinds = [kind for _, kind in plan.nodes(data='kind')]
+    issued = control['query_count']
+    naive = control['naive_queries']
+    return {
+        'compare_tasks': kinds.count('compare'),
+        'requested_lookups': plan.graph['requested_lookups'],
+        'unique_lookups': kinds.count('lookup'),
+        'batched_queries': kinds.count('batch'),
+        'planned_queries': kinds.count('query'),
+        'peak_concurrency': control['peak_concurrency'],
+        'queries_issued': issued,
+        'naive_queries': naive,
+        'queries_saved': naive - issued
+    }
+
+def finalize_stopped_run(session):
+    """
+    Wrap up a run that was interrupted by Stop or by any other rerun
+    In-flight queries are cancelled by query ID and unfinished tables are reported as CANCELLED
+    """
+    control = end_run_control(session)
+    if control is None:
+        return None
+
+    for query_id in list(control['inflight']):
+        try:
+            session.sql(f"SELECT SYSTEM$CANCEL_QUERY('{query_id}')").collect()
+        except Exception:
+            pass
+
+    rows = list(control['finished'])
+    unfinished = control['running'] + control['pending']
+    for schema1, schema2, table_name in unfinished:
+        rows.append(build_status_result(schema1, schema2, table_name, 'CANCELLED'))
+
+    status_counts = {}
+    for row in rows:
+        status_counts[row['status']] = status_counts.get(row['status'], 0) + 1
+
+    saved_run = {
+        'results': pd.DataFrame(rows),
+        'db1': control['db1'],
+        'db2': control['db2'],
+        'status_counts': status_counts,
+        'plan_stats': get_plan_stats(control)
+    }
+    st.session_state[control['run_key']] = saved_run
+    return saved_run
+
+def get_table_columns(session, database, schema, table_name):
+    """Get the column names of a table in ordinal order"""
+    prefetched = get_plan_result('columns', database, schema)
+    if prefetched is not None and table_name in prefetched:
+        return list(prefetched[table_name])
+
+    columns_query = f"""
+    SELECT COLUMN_NAME
+    FROM {database}.INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = '{schema}' AND TABLE_NAME = '{table_name}'
+    ORDER BY ORDINAL_POSITION
+    """
+    columns_df = run_query(session, columns_query, 'pandas')
+    return columns_df['COLUMN_NAME'].tolist()
+
+def get_column_rules():
+    """Get the active column rules as a list of dicts"""
+    return st.session_state.get('column_rules', [])
+
+def matches_rule_pattern(pattern, value):
+    """Match a glob pattern, or a regex prefixed with re:, case-insensitively"""
+    if pattern.startswith('re:'):
+        return re.fullmatch(pattern[3:], value, re.IGNORECASE) is not None
+    return fnmatch.fnmatchcase(value.upper(), pattern.upper())
+
+def get_column_rule(rules, schema, table_name, column_name):
+    """
+    Get the rule that applies to a column, or None
+    Table rules take precedence over schema rules, which take precedence over global rules
+    """
+    for scope in ('TABLE', 'SCHEMA', 'GLOBAL'):
+        for rule in rules:
+            if rule['scope'] != scope or not matches_rule_pattern(rule['column'], column_name):
+                continue
+            if scope == 'TABLE' and not matches_rule_pattern(rule['target'], f"{schema}.{table_name}"):
+                continue
+            if scope == 'SCHEMA' and not matches_rule_pattern(rule['target'], schema):
+                continue
+            return rule
+    return None
+
+def apply_column_rules(column_names, schema, table_name, rules):
+    """
+    Turn column names into (name, expression) pairs after applying column rules
+    Excluded columns are dropped; normalized columns are wrapped in the matching SQL function
+    """
+    columns = []
+    for column_name in column_names:
+        quoted = f'"{column_name}"'
+        rule = get_column_rule(rules, schema, table_name, column_name)
+        action = rule['action'] if rule else None
+        argument = (rule.get('argument') or COLUMN_RULE_DEFAULT_ARGUMENTS.get(action, '')) if rule else ''
+        if action == 'EXCLUDE':
+            continue
+        elif action == 'ROUND':
+            columns.append((column_name, f"ROUND({quoted}, {int(argument)})"))
+        elif action == 'TRIM':
+            columns.append((column_name, f"TRIM({quoted})"))
+        elif action == 'UPPER':
+            columns.append((column_name, f"UPPER({quoted})"))
+        elif action == 'TO_STRING':
+            columns.append((column_name, f"TO_VARCHAR({quoted})"))
+        else:
+            columns.append((column_name, quoted))
+    if not columns:
+        raise ValueError(f"All columns of {schema}.{table_name} are excluded by column rules")
+    return columns
+
+def get_comparison_columns(session, database, schema, table_name):
+    """
+    Get the (name, expression) pairs compared for a table
+    Rules are applied inside the generated SQL, so excluded columns are never read
+    """
+    column_names = get_table_columns(session, database, schema, table_name)
+    if not column_names:
+        raise ValueError(f"No columns found for {database}.{schema}.{table_name}")
+    return apply_column_rules(column_names, schema, table_name, get_column_rules())
+
+def get_select_list(columns):
+    """Build a SELECT list from (name, expression) pairs, keeping the original column names"""
+    return ', '.join([expr if expr == f'"{name}"' else f'{expr} as "{name}"' for name, expr in columns])
+
+def get_table_ref(database, schema, table_name, offset=None):
+    """Reference a table, as of an offset when one is given (Time Travel)"""
+    table_full = f"{database}.{schema}.{table_name}"
+    if offset is None:
+        return table_full
+    return f"{table_full} AT(TIMESTAMP => TO_TIMESTAMP_TZ('{offset}', '{OFFSET_FORMAT}'))"
+
+def get_hash_list(columns):
+    """Build the argument list of HASH / HASH_AGG from (name, expression) pairs"""
+    return ', '.join([expr for name, expr in columns])
+
+def save_job_config(session, config_table, config_name, config):
+    """Save a named job configuration (for example column rules) as JSON in a Snowflake table"""
+    session.sql(f"""
+    CREATE TABLE IF NOT EXISTS {config_table} (
+        config_name STRING,
+        config VARIANT,
+        updated_at TIMESTAMP_LTZ
+    )
+    """).collect()
+    session.sql(f"""
+    MERGE INTO {config_table} t
+    USING (SELECT ? as config_name, PARSE_JSON(?) as config) s
+    ON t.config_name = s.config_name
+    WHEN MATCHED THEN UPDATE SET config = s.config, updated_at = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT (config_name, config, updated_at)
+    VALUES (s.config_name, s.config, CURRENT_TIMESTAMP())
+    """, params=[config_name, json.dumps(config)]).collect()
+
+def load_job_config(session, config_table, config_name):
+    """Load a named job configuration, or None if it does not exist"""
+    rows = session.sql(
+        f"SELECT TO_JSON(config) as config FROM {config_table} WHERE config_name = ?",
+        params=[config_name]
+    ).collect()
+    if not rows:
+        return None
+    return json.loads(rows[0]['CONFIG'])
+
+def get_strategy_timings():
+    """Get the elapsed seconds of past strategies, keyed by table pair and strategy"""
+    return st.session_state.setdefault('strategy_timings', {})
+
+def load_strategy_timings(session):
+    """Merge the strategy timings kept in the job config table into this session's, if a table is set"""
+    config_table = st.session_state.get('config_table', '').strip()
+    if not config_table:
+        return
+    try:
+        config = load_job_config(session, config_table, STRATEGY_TIMINGS_CONFIG_NAME)
+    except Exception:
+        return
+    if config is not None:
+        timings = get_strategy_timings()
+        # Timings taken in this session are newer than the stored ones
+        st.session_state['strategy_timings'] = {**config.get('strategy_timings', {}), **timings}
+
+def save_strategy_timings(session):
+    """Keep this session's strategy timings in the job config table, if a table is set"""
+    config_table = st.session_state.get('config_table', '').strip()
+    if not config_table:
+        return
+    try:
+        save_job_config(session, config_table, STRATEGY_TIMINGS_CONFIG_NAME, {'strategy_timings': get_strategy_timings()})
+    except Exception:
+        pass
+
+def get_table_metadata(session, database, schema, table_name):
+    """
+    Get row count, size, table type and declared primary key of a table
+    Values that cannot be read from metadata are left as None / empty
+    """
+    metadata = {'row_count': None, 'bytes': None, 'table_type': None, 'key_columns': []}
+
+    prefetched = get_plan_result('metadata', database, schema)
+    if prefetched is not None:
+        metadata.update(prefetched.get(table_name, {}))
+    else:
+        try:
+            query = f"""
+            SELECT ROW_COUNT, BYTES, TABLE_TYPE
+            FROM {database}.INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = '{schema}' AND TABLE_NAME = '{table_name}'
+            """
+            rows = run_query(session, query)
+            if rows:
+                metadata['row_count'] = rows[0]['ROW_COUNT']
+                metadata['bytes'] = rows[0]['BYTES']
+                metadata['table_type'] = rows[0]['TABLE_TYPE']
+        except Exception:
+            pass
+
+    prefetched_keys = get_plan_result('keys', database, schema)
+    if prefetched_keys is not None:
+        metadata['key_columns'] = list(prefetched_keys.get(table_name, []))
+    else:
+        try:
+            keys_df = run_query(session, f"SHOW PRIMARY KEYS IN TABLE {database}.{schema}.{table_name}", 'pandas')
+            # SHOW output column names may come back quoted and in either case
+            keys_df.columns = [col.strip('"').lower() for col in keys_df.columns]
+            if 'column_name' in keys_df.columns:
+                if 'key_sequence' in keys_df.columns:
+                    keys_df = keys_df.sort_values('key_sequence')
+                metadata['key_columns'] = keys_df['column_name'].tolist()
+        except Exception:
+            pass
+
+    return metadata
+
+def get_count_query(table_ref):
+    """Build the row count query of a table; tasks issue the same text so a table is counted once"""
+    return f"SELECT COUNT(*) as count FROM {table_ref}"
+
+def choose_comparison_strategy(source_meta, target_meta, policy='AUTO', past_timings=None, compared_columns=None):
+    """
+    Pick the cheapest comparison strategy that is sufficient for a table pair
+    compared_columns, if given, are the column names left after column rules
+    Returns a (strategy, reason) tuple
+    """
+    past_timings = past_timings or {}
+
+    if policy == 'FULL_MINUS_ONLY':
+        return STRATEGY_FULL_MINUS, "Policy requires full MINUS"
+
+    rows1 = source_meta['row_count']
+    rows2 = target_meta['row_count']
+    if rows1 is None or rows2 is None:
+        table_type = source_meta['table_type'] if rows1 is None else target_meta['table_type']
+        return STRATEGY_FULL_MINUS, f"Row count not available from metadata ({table_type or 'unknown type'})"
+
+    if rows1 != rows2:
+        return STRATEGY_METADATA_COUNT, f"Row counts differ ({rows1:,} vs {rows2:,})"
+
+    if rows1 <= SMALL_TABLE_ROWS:
+        return STRATEGY_FULL_MINUS, f"Small table ({rows1:,} rows)"
+
+    minus_seconds = past_timings.get(STRATEGY_FULL_MINUS)
+    if minus_seconds is not None and minus_seconds <= MINUS_TIME_BUDGET_SECONDS:
+        return STRATEGY_FULL_MINUS, f"Previous full MINUS finished in {minus_seconds:.1f}s"
+
+    key_columns = source_meta['key_columns']
+    if key_columns and key_columns == target_meta['key_columns']:
+        excluded_keys = [col for col in key_columns if compared_columns is not None and col not in compared_columns]
+        if excluded_keys:
+            # Bucketing on an excluded column would read it
+            return STRATEGY_HASH_AGGREGATE, f"Large table ({rows1:,} rows); primary key column(s) {', '.join(excluded_keys)} excluded by column rules"
+        return STRATEGY_BUCKETED_DIFF, f"Large table ({rows1:,} rows) with primary key {', '.join(key_columns)}"
+
+    # Sampling never proves a match, so it is only used when the policy opts into it
+    if rows1 > LARGE_TABLE_ROWS and policy == 'AUTO_SAMPLING':
+        return STRATEGY_SAMPLING, f"Very large table ({rows1:,} rows) without primary key; approximate result"
+
+    return STRATEGY_HASH_AGGREGATE, f"Large table ({rows1:,} rows) without primary key"
+
+def get_diff_cache():
+    """Get the registry of materialized diffs, keyed by table pair"""
+    return st.session_state.setdefault('diff_cache', {})
+
+def get_diff_cache_session_id():
+    """Get the id that keeps the diff tables of this session apart from those of other sessions"""
+    return st.session_state.setdefault('diff_cache_session_id', uuid.uuid4().hex[:8].upper())
+
+def get_pair_key(db1, schema1, db2, schema2, table_name):
+    """Build the key identifying a source/target table pair"""
+    return f"{db1}.{schema1}.{table_name}|{db2}.{schema2}.{table_name}"
+
+def evict_diff_cache_entry(session, pair_key):
+    """Drop the materialized diff tables of a table pair and forget the entry"""
+    entry = get_diff_cache().pop(pair_key, None)
+    if entry is None:
+        return
+    for cache_table in (entry['source_only_table'], entry['target_only_table']):
+        try:
+            session.sql(f"DROP TABLE IF EXISTS {cache_table}").collect()
+        except Exception:
+            pass
+
+def evict_expired_diff_cache(session):
+    """Drop every materialized diff whose TTL has passed"""
+    now = time.time()
+    for pair_key, entry in list(get_diff_cache().items()):
+        if entry['expires_at'] <= now:
+            evict_diff_cache_entry(session, pair_key)
+
+def sweep_expired_diff_tables(session, cache_location):
+    """
+    Drop expired diff tables left under cache_location by any session
+    A session that ended never evicts its own entries, so the expiry is read from each table comment
+    """
+    try:
+        rows = session.sql(f"SHOW TABLES LIKE 'DIFF_%' IN SCHEMA {cache_location}").collect()
+    except Exception:
+        return
+    now = time.time()
+    for row in rows:
+        # SHOW output column names may come back quoted and in either case
+        values = {key.strip('"').lower(): value for key, value in row.as_dict().items()}
+        match = re.match(r"Diff cache for .*, expires (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) UTC$", values.get('comment') or '')
+        if match is None or calendar.timegm(time.strptime(match.group(1), '%Y-%m-%d %H:%M:%S')) > now:
+            continue
+        try:
+            session.sql(f"DROP TABLE IF EXISTS {cache_location}.{values['name']}").collect()
+        except Exception:
+            pass
+
+def get_cached_diff(db1, schema1, db2, schema2, table_name):
+    """
+    Get the live cache entry of a table pair, or None
+    An entry built over other column expressions than the current column rules give is stale
+    """
+    entry = get_diff_cache().get(get_pair_key(db1, schema1, db2, schema2, table_name))
+    if entry is None or entry['expires_at'] <= time.time():
+        return None
+    try:
+        columns = apply_column_rules(entry['source_columns'], schema1, table_name, get_column_rules())
+    except ValueError:
+        return None
+    if get_columns_fingerprint(get_hash_list(columns)) != entry['columns_hash']:
+        return None
+    return entry
+
+def materialize_table_diff(session, db1, schema1, db2, schema2, table_name, columns,
+                           cache_location, ttl_minutes=DIFF_CACHE_TTL_MINUTES, at_offset=None, diff_selects=None):
+    """
+    Query task: run each MINUS direction once into a transient table under cache_location
+    diff_selects, if given, are the (source only, target only) queries of a strategy that
+    only diffs part of the tables; they must return exactly the rows a full MINUS would
+    Any previous entry for the pair is replaced; the expiry is also kept in the table comment,
+    where sweep_expired_diff_tables finds it after the session that created the table is gone
+    """
+    pair_key = get_pair_key(db1, schema1, db2, schema2, table_name)
+    evict_diff_cache_entry(session, pair_key)
+
+    table1_full = get_table_ref(db1, schema1, table_name, at_offset)
+    table2_full = get_table_ref(db2, schema2, table_name, at_offset)
+    columns_str = get_select_list(columns)
+    if diff_selects is None:
+        diff_selects = (
+            f"SELECT {columns_str} FROM {table1_full} MINUS SELECT {columns_str} FROM {table2_full}",
+            f"SELECT {columns_str} FROM {table2_full} MINUS SELECT {columns_str} FROM {table1_full}"
+        )
+    # The session id keeps sessions comparing the same pair from replacing each other's tables
+    pair_hash = hashlib.md5(pair_key.encode('utf-8')).hexdigest()[:12].upper()
+    cache_prefix = f"{cache_location}.DIFF_{get_diff_cache_session_id()}_{pair_hash}"
+    expires_at = time.time() + ttl_minutes * 60
+    comment = f"Diff cache for {pair_key}, expires {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(expires_at))} UTC"
+
+    entry = {
+        'source_only_table': f"{cache_prefix}_SOURCE_ONLY",
+        'target_only_table': f"{cache_prefix}_TARGET_ONLY",
+        'column_names': [name for name, expr in columns],
+        'source_columns': get_table_columns(session, db1, schema1, table_name),
+        'columns_hash': get_columns_fingerprint(get_hash_list(columns)),
+        'created_at': time.time(),
+        'expires_at': expires_at
+    }
+    create_query = """
+    CREATE OR REPLACE TRANSIENT TABLE {cache_table}
+    DATA_RETENTION_TIME_IN_DAYS = 0
+    COMMENT = '{comment}'
+    AS
+    {diff_select}
+    """
+    yield plan_queries(
+        create_query.format(cache_table=entry['source_only_table'], comment=comment, diff_select=diff_selects[0]),
+        create_query.format(cache_table=entry['target_only_table'], comment=comment, diff_select=diff_selects[1])
+    )
+
+    get_diff_cache()[pair_key] = entry
+    return entry
+
+def count_materialized_diff(entry):
+    """Query task: count the rows of both directions of a materialized diff"""
+    diff1_rows, diff2_rows = yield plan_queries(
+        f"SELECT COUNT(*) as diff_count FROM {entry['source_only_table']}",
+        f"SELECT COUNT(*) as diff_count FROM {entry['target_only_table']}"
+    )
+    return diff1_rows[0]['DIFF_COUNT'], diff2_rows[0]['DIFF_COUNT']
+
+def get_diff_rows_page(session, entry, side, page, page_size=DIFF_PAGE_SIZE):
+    """Read one page of rows from a materialized diff"""
+    cache_table = entry['source_only_table'] if side == 'SOURCE_ONLY' else entry['target_only_table']
+    order_str = ', '.join([f'"{col}"' for col in entry['column_names']])
+    query = f"""
+    SELECT * FROM {cache_table}
+    ORDER BY {order_str}
+    LIMIT {page_size} OFFSET {page * page_size}
+    """
+    return session.sql(query).to_pandas()
+
+def compare_table_data_minus(session, db1, schema1, db2, schema2, table_name,
+                             cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES, at_offset=None):
+    """
+    Query task: compare data between two tables using MINUS operation
     Only perform MINUS if row counts match, else mark as COUNT_MISMATCH
+    With a cache location, each MINUS direction is materialized once for drill-down and export
+    With an offset, both tables are read as of that offset
     """
     try:
-        table1_full = f"{db1}.{schema1}.{table_name}"
-        table2_full = f"{db2}.{schema2}.{table_name}"
+        table1_full = get_table_ref(db1, schema1, table_name, at_offset)
+        table2_full = get_table_ref(db2, schema2, table_name, at_offset)
 
-        # Get column names for the table and add double quotes
-        columns_query = f"""
-        SELECT COLUMN_NAME
-        FROM {db1}.INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = '{schema1}' AND TABLE_NAME = '{table_name}'
-        ORDER BY ORDINAL_POSITION
-        """
-        columns_df = session.sql(columns_query).to_pandas()
-        column_names = columns_df['COLUMN_NAME'].tolist()
-        quoted_columns = [f'"{col}"' for col in column_names]
-        columns_str = ', '.join(quoted_columns)
+        # Get the compared column expressions after column rules
+        columns = get_comparison_columns(session, db1, schema1, table_name)
+        columns_str = get_select_list(columns)
 
         # Get row counts for both tables
-        count1_query = f"SELECT COUNT(*) as count FROM {table1_full}"
-        count2_query = f"SELECT COUNT(*) as count FROM {table2_full}"
-
-        count1 = session.sql(count1_query).collect()[0]['COUNT']
-        count2 = session.sql(count2_query).collect()[0]['COUNT']
+        count1_rows, count2_rows = yield plan_queries(get_count_query(table1_full), get_count_query(table2_full))
+        count1 = count1_rows[0]['COUNT']
+        count2 = count2_rows[0]['COUNT']
 
         if count1 != count2:
             # If counts don't match, skip MINUS and mark as COUNT_MISMATCH
@@ -130,196 +798,1765 @@ def compare_table_data_minus(session, db1, schema1, db2, schema2, table_name):
                 'status': 'COUNT_MISMATCH'
             }
 
-        # Perform MINUS operations in both directions using explicit columns
-        minus1_query = f"""
-        SELECT COUNT(*) as diff_count FROM (
-            SELECT {columns_str} FROM {table1_full}
-            MINUS
-            SELECT {columns_str} FROM {table2_full}
-        )
-        """
+        if cache_location:
+            # Materialize both directions once; counts come from the cached tables
+            entry = yield from materialize_table_diff(
+                session, db1, schema1, db2, schema2, table_name, columns, cache_location, cache_ttl_minutes, at_offset
+            )
+            diff1, diff2 = yield from count_materialized_diff(entry)
+            tables_match = (diff1 == 0 and diff2 == 0 and count1 == count2)
+            return {
+                'source_schema': schema1,
+                'target_schema': schema2,
+                'table_name': table_name,
+                'count1': count1,
+                'count2': count2,
+                'rows_in_table1_not_in_table2': diff1,
+                'rows_in_table2_not_in_table1': diff2,
+                'data_match': tables_match,
+                'status': 'MATCH' if tables_match else 'MISMATCH'
+            }
+
+        # Perform MINUS operations in both directions using explicit columns
+        minus1_query = f"""
+        SELECT COUNT(*) as diff_count FROM (
+            SELECT {columns_str} FROM {table1_full}
+            MINUS
+            SELECT {columns_str} FROM {table2_full}
+        )
+        """
+
+        minus2_query = f"""
+        SELECT COUNT(*) as diff_count FROM (
+            SELECT {columns_str} FROM {table2_full}
+            MINUS
+            SELECT {columns_str} FROM {table1_full}
+        )
+        """
+
+        diff1_rows, diff2_rows = yield plan_queries(minus1_query, minus2_query)
+        diff1 = diff1_rows[0]['DIFF_COUNT']
+        diff2 = diff2_rows[0]['DIFF_COUNT']
+
+        # Determine if tables match
+        tables_match = (diff1 == 0 and diff2 == 0 and count1 == count2)
+
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': count1,
+            'count2': count2,
+            'rows_in_table1_not_in_table2': diff1,
+            'rows_in_table2_not_in_table1': diff2,
+            'data_match': tables_match,
+            'status': 'MATCH' if tables_match else 'MISMATCH'
+        }
+
+    except Exception as e:
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': 'ERROR',
+            'count2': 'ERROR',
+            'rows_in_table1_not_in_table2': 'ERROR',
+            'rows_in_table2_not_in_table1': 'ERROR',
+            'data_match': False,
+            'status': get_error_status(e),
+            'error': str(e)
+        }
+
+def compare_table_counts_metadata(session, db1, schema1, db2, schema2, table_name, source_meta, target_meta):
+    """
+    Compare two tables on their row counts only
+    Used when the counts already differ, so no table scan is needed
+    """
+    count1 = source_meta['row_count']
+    count2 = target_meta['row_count']
+    return {
+        'source_schema': schema1,
+        'target_schema': schema2,
+        'table_name': table_name,
+        'count1': count1,
+        'count2': count2,
+        'rows_in_table1_not_in_table2': 'N/A',
+        'rows_in_table2_not_in_table1': 'N/A',
+        'data_match': False,
+        'status': 'COUNT_MISMATCH' if count1 != count2 else 'MATCH'
+    }
+
+def compare_table_data_hash(session, db1, schema1, db2, schema2, table_name,
+                            cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES, at_offset=None):
+    """
+    Query task: compare two tables with one HASH_AGG scan per side
+    Falls back to MINUS only when the aggregate hashes differ
+    """
+    try:
+        table1_full = get_table_ref(db1, schema1, table_name, at_offset)
+        table2_full = get_table_ref(db2, schema2, table_name, at_offset)
+
+        columns = get_comparison_columns(session, db1, schema1, table_name)
+        hash_str = get_hash_list(columns)
+
+        hash1_rows, hash2_rows = yield plan_queries(
+            f"SELECT COUNT(*) as count, HASH_AGG({hash_str}) as table_hash FROM {table1_full}",
+            f"SELECT COUNT(*) as count, HASH_AGG({hash_str}) as table_hash FROM {table2_full}"
+        )
+        hash1 = hash1_rows[0]
+        hash2 = hash2_rows[0]
+
+        if hash1['COUNT'] == hash2['COUNT'] and hash1['TABLE_HASH'] == hash2['TABLE_HASH']:
+            return {
+                'source_schema': schema1,
+                'target_schema': schema2,
+                'table_name': table_name,
+                'count1': hash1['COUNT'],
+                'count2': hash2['COUNT'],
+                'rows_in_table1_not_in_table2': 0,
+                'rows_in_table2_not_in_table1': 0,
+                'data_match': True,
+                'status': 'MATCH'
+            }
+
+        # Hashes differ, so compute exact difference counts
+        result = yield from compare_table_data_minus(
+            session, db1, schema1, db2, schema2, table_name, cache_location, cache_ttl_minutes, at_offset
+        )
+        result['strategy'] = STRATEGY_FULL_MINUS
+        result['strategy_reason'] = "Aggregate hashes differ; fell back to full MINUS"
+        return result
+
+    except Exception as e:
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': 'ERROR',
+            'count2': 'ERROR',
+            'rows_in_table1_not_in_table2': 'ERROR',
+            'rows_in_table2_not_in_table1': 'ERROR',
+            'data_match': False,
+            'status': get_error_status(e),
+            'error': str(e)
+        }
+
+def compare_table_data_bucketed(session, db1, schema1, db2, schema2, table_name, key_columns,
+                                cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES, at_offset=None):
+    """
+    Query task: compare two tables by hashing rows into buckets on the primary key
+    Only buckets whose hashes differ are diffed with MINUS. Key columns are bucketed on their
+    normalized expressions, so rows that match after column rules land in the same bucket.
+    With a cache location, the MINUS of the changed buckets is materialized; rows in the other
+    buckets are identical on both sides, so it holds the whole diff.
+    """
+    try:
+        table1_full = get_table_ref(db1, schema1, table_name, at_offset)
+        table2_full = get_table_ref(db2, schema2, table_name, at_offset)
+
+        columns = get_comparison_columns(session, db1, schema1, table_name)
+        columns_str = get_select_list(columns)
+        hash_str = get_hash_list(columns)
+        column_exprs = dict(columns)
+        excluded_keys = [col for col in key_columns if col not in column_exprs]
+        if excluded_keys:
+            raise ValueError(f"Primary key column(s) {', '.join(excluded_keys)} are excluded by column rules")
+        key_str = ', '.join([column_exprs[col] for col in key_columns])
+        bucket_expr = f"MOD(ABS(HASH({key_str})), {DIFF_BUCKETS})"
+
+        buckets_query = """
+        SELECT {bucket} as bucket, COUNT(*) as row_count, HASH_AGG({columns}) as bucket_hash
+        FROM {table}
+        GROUP BY 1
+        """
+        buckets1, buckets2 = yield plan_queries(
+            buckets_query.format(bucket=bucket_expr, columns=hash_str, table=table1_full),
+            buckets_query.format(bucket=bucket_expr, columns=hash_str, table=table2_full),
+            result_type='pandas'
+        )
+
+        count1 = int(buckets1['ROW_COUNT'].sum())
+        count2 = int(buckets2['ROW_COUNT'].sum())
+
+        merged = buckets1.merge(buckets2, on='BUCKET', how='outer', suffixes=('_1', '_2'))
+        changed = merged[
+            (merged['ROW_COUNT_1'] != merged['ROW_COUNT_2']) |
+            (merged['BUCKET_HASH_1'] != merged['BUCKET_HASH_2'])
+        ]
+        changed_buckets = sorted(int(b) for b in changed['BUCKET'])
+
+        if not changed_buckets:
+            diff1 = 0
+            diff2 = 0
+        else:
+            bucket_filter = f"{bucket_expr} IN ({', '.join(str(b) for b in changed_buckets)})"
+            minus1_select = f"""
+                SELECT {columns_str} FROM {table1_full} WHERE {bucket_filter}
+                MINUS
+                SELECT {columns_str} FROM {table2_full} WHERE {bucket_filter}
+            """
+            minus2_select = f"""
+                SELECT {columns_str} FROM {table2_full} WHERE {bucket_filter}
+                MINUS
+                SELECT {columns_str} FROM {table1_full} WHERE {bucket_filter}
+            """
+            if cache_location:
+                entry = yield from materialize_table_diff(
+                    session, db1, schema1, db2, schema2, table_name, columns, cache_location, cache_ttl_minutes,
+                    at_offset, (minus1_select, minus2_select)
+                )
+                diff1, diff2 = yield from count_materialized_diff(entry)
+            else:
+                diff1_rows, diff2_rows = yield plan_queries(
+                    f"SELECT COUNT(*) as diff_count FROM ({minus1_select})",
+                    f"SELECT COUNT(*) as diff_count FROM ({minus2_select})"
+                )
+                diff1 = diff1_rows[0]['DIFF_COUNT']
+                diff2 = diff2_rows[0]['DIFF_COUNT']
+
+        tables_match = (diff1 == 0 and diff2 == 0 and count1 == count2)
+
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': count1,
+            'count2': count2,
+            'rows_in_table1_not_in_table2': diff1,
+            'rows_in_table2_not_in_table1': diff2,
+            'data_match': tables_match,
+            'status': 'MATCH' if tables_match else 'MISMATCH'
+        }
+
+    except Exception as e:
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': 'ERROR',
+            'count2': 'ERROR',
+            'rows_in_table1_not_in_table2': 'ERROR',
+            'rows_in_table2_not_in_table1': 'ERROR',
+            'data_match': False,
+            'status': get_error_status(e),
+            'error': str(e)
+        }
+
+def compare_table_data_sampled(session, db1, schema1, db2, schema2, table_name, row_count):
+    """
+    Query task: compare a deterministic hash sample of two tables and scale the differences up
+    Identical rows land in the same sample on both sides, so the estimate is unbiased.
+    Differences found in the sample are real, but a clean sample is only reported as
+    SAMPLED_MATCH since rows outside the sample were never compared.
+    """
+    try:
+        table1_full = f"{db1}.{schema1}.{table_name}"
+        table2_full = f"{db2}.{schema2}.{table_name}"
+
+        columns = get_comparison_columns(session, db1, schema1, table_name)
+        columns_str = get_select_list(columns)
+        modulus = max(1, row_count // SAMPLE_TARGET_ROWS)
+        sample_filter = f"MOD(ABS(HASH({get_hash_list(columns)})), {modulus}) = 0"
+
+        minus1_query = f"""
+        SELECT COUNT(*) as diff_count FROM (
+            SELECT {columns_str} FROM {table1_full} WHERE {sample_filter}
+            MINUS
+            SELECT {columns_str} FROM {table2_full} WHERE {sample_filter}
+        )
+        """
+        minus2_query = f"""
+        SELECT COUNT(*) as diff_count FROM (
+            SELECT {columns_str} FROM {table2_full} WHERE {sample_filter}
+            MINUS
+            SELECT {columns_str} FROM {table1_full} WHERE {sample_filter}
+        )
+        """
+        diff1_rows, diff2_rows = yield plan_queries(minus1_query, minus2_query)
+        diff1 = diff1_rows[0]['DIFF_COUNT'] * modulus
+        diff2 = diff2_rows[0]['DIFF_COUNT'] * modulus
+        sample_clean = (diff1 == 0 and diff2 == 0)
+
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': row_count,
+            'count2': row_count,
+            'rows_in_table1_not_in_table2': diff1,
+            'rows_in_table2_not_in_table1': diff2,
+            'data_match': False,
+            'status': 'SAMPLED_MATCH' if sample_clean else 'MISMATCH',
+            'approximate': True
+        }
+
+    except Exception as e:
+        return {
+            'source_schema': schema1,
+            'target_schema': schema2,
+            'table_name': table_name,
+            'count1': 'ERROR',
+            'count2': 'ERROR',
+            'rows_in_table1_not_in_table2': 'ERROR',
+            'rows_in_table2_not_in_table1': 'ERROR',
+            'data_match': False,
+            'status': get_error_status(e),
+            'error': str(e)
+        }
+
+def estimate_table_overlap(session, db1, schema1, db2, schema2, table_name, at_offset=None):
+    """
+    Query task: estimate how many distinct rows are only in the source, only in the target and shared
+    Uses one HyperLogLog aggregate scan per side; the union comes from HLL_COMBINE of both sketches.
+    Each estimate comes with an error bound: inclusion-exclusion subtracts large estimates, so the
+    whole HLL error of its terms lands on the small difference.
+    With an offset, both tables are read as of that offset, like the counts they explain.
+    """
+    table1_full = get_table_ref(db1, schema1, table_name, at_offset)
+    table2_full = get_table_ref(db2, schema2, table_name, at_offset)
+
+    hash_str = get_hash_list(get_comparison_columns(session, db1, schema1, table_name))
+
+    sketch_query = f"""
+    WITH source_sketch AS (
+        SELECT HLL_ACCUMULATE(HASH({hash_str})) as sketch FROM {table1_full}
+    ),
+    target_sketch AS (
+        SELECT HLL_ACCUMULATE(HASH({hash_str})) as sketch FROM {table2_full}
+    ),
+    union_sketch AS (
+        SELECT HLL_COMBINE(sketch) as sketch FROM (
+            SELECT sketch FROM source_sketch
+            UNION ALL
+            SELECT sketch FROM target_sketch
+        )
+    )
+    SELECT
+        HLL_ESTIMATE(s.sketch) as source_distinct,
+        HLL_ESTIMATE(t.sketch) as target_distinct,
+        HLL_ESTIMATE(u.sketch) as union_distinct
+    FROM source_sketch s, target_sketch t, union_sketch u
+    """
+    sketch_rows, = yield plan_queries(sketch_query)
+    row = sketch_rows[0]
+    source_distinct = row['SOURCE_DISTINCT']
+    target_distinct = row['TARGET_DISTINCT']
+    union_distinct = max(row['UNION_DISTINCT'], source_distinct, target_distinct)
+
+    # Inclusion-exclusion on the estimates; clamp the noise around zero
+    return {
+        'source_only': max(0, union_distinct - target_distinct),
+        'target_only': max(0, union_distinct - source_distinct),
+        'shared': max(0, source_distinct + target_distinct - union_distinct),
+        'source_only_error': round(HLL_RELATIVE_ERROR * (union_distinct + target_distinct)),
+        'target_only_error': round(HLL_RELATIVE_ERROR * (union_distinct + source_distinct)),
+        'shared_error': round(HLL_RELATIVE_ERROR * (source_distinct + target_distinct + union_distinct))
+    }
+
+def format_overlap_estimate(overlap, name):
+    """Show an overlap estimate, or only its error bound when the estimate is within it"""
+    estimate = overlap[name]
+    error_bound = overlap[f"{name}_error"]
+    if 0 < error_bound and estimate <= error_bound:
+        return f"≤ {error_bound:,}"
+    return f"~{estimate:,}"
+
+def compare_table_data(session, db1, schema1, db2, schema2, table_name, policy='AUTO', estimate_overlap=True,
+                       cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES, at_offset=None):
+    """
+    Query task: compare two tables using the strategy picked by choose_comparison_strategy
+    The chosen strategy, the reason for it and the elapsed time are added to the result.
+    With an offset, the exact strategies read both tables as of that offset.
+    """
+    source_meta = get_table_metadata(session, db1, schema1, table_name)
+    target_meta = get_table_metadata(session, db2, schema2, table_name)
+
+    # Metadata may have been prefetched long before this table's turn, so the counts that decide
+    # on a count mismatch are taken now; the strategies reuse them within this table's task
+    if source_meta['row_count'] is not None and target_meta['row_count'] is not None:
+        try:
+            count1_rows, count2_rows = yield plan_queries(
+                get_count_query(get_table_ref(db1, schema1, table_name, at_offset)),
+                get_count_query(get_table_ref(db2, schema2, table_name, at_offset))
+            )
+            source_meta['row_count'] = count1_rows[0]['COUNT']
+            target_meta['row_count'] = count2_rows[0]['COUNT']
+        except Exception as e:
+            if get_error_status(e) in ('TIMEOUT', 'CANCELLED'):
+                return build_status_result(schema1, schema2, table_name, get_error_status(e), str(e))
+
+    # Past timings, kept in the job config table across sessions, feed the next choice
+    timings = get_strategy_timings()
+    pair_key = get_pair_key(db1, schema1, db2, schema2, table_name)
+    try:
+        compared_columns = [name for name, expr in get_comparison_columns(session, db1, schema1, table_name)]
+    except Exception:
+        # The chosen strategy reports the same error; just never bucket on unknown columns
+        compared_columns = []
+    strategy, reason = choose_comparison_strategy(source_meta, target_meta, policy, timings.get(pair_key), compared_columns)
+
+    start_time = time.time()
+    if strategy == STRATEGY_METADATA_COUNT:
+        result = compare_table_counts_metadata(session, db1, schema1, db2, schema2, table_name, source_meta, target_meta)
+    elif strategy == STRATEGY_HASH_AGGREGATE:
+        result = yield from compare_table_data_hash(session, db1, schema1, db2, schema2, table_name, cache_location, cache_ttl_minutes, at_offset)
+    elif strategy == STRATEGY_BUCKETED_DIFF:
+        result = yield from compare_table_data_bucketed(
+            session, db1, schema1, db2, schema2, table_name, source_meta['key_columns'], cache_location, cache_ttl_minutes, at_offset
+        )
+    elif strategy == STRATEGY_SAMPLING:
+        result = yield from compare_table_data_sampled(session, db1, schema1, db2, schema2, table_name, source_meta['row_count'])
+    else:
+        result = yield from compare_table_data_minus(session, db1, schema1, db2, schema2, table_name, cache_location, cache_ttl_minutes, at_offset)
+    elapsed = time.time() - start_time
+
+    result.setdefault('strategy', strategy)
+    result.setdefault('strategy_reason', reason)
+    result.setdefault('approximate', False)
+
+    if result['status'] in ('MATCH', 'SAMPLED_MATCH', 'MISMATCH', 'COUNT_MISMATCH'):
+        timings.setdefault(pair_key, {})[result['strategy']] = elapsed
+
+    # Count mismatches skip the MINUS, so give an approximate idea of how far apart the tables are
+    if result['status'] == 'COUNT_MISMATCH' and estimate_overlap:
+        try:
+            overlap = yield from estimate_table_overlap(session, db1, schema1, db2, schema2, table_name, at_offset)
+            result['rows_in_table1_not_in_table2'] = format_overlap_estimate(overlap, 'source_only')
+            result['rows_in_table2_not_in_table1'] = format_overlap_estimate(overlap, 'target_only')
+            result['estimated_shared_rows'] = format_overlap_estimate(overlap, 'shared')
+            result['approximate'] = True
+        except Exception as e:
+            # The count mismatch stands; only the estimate is missing
+            result['estimate_error'] = str(e)
+
+    result['elapsed_seconds'] = round(time.time() - start_time, 2)
+
+    return result
+
+def ensure_incremental_state_table(session, state_table):
+    """Create the table holding validated offsets and base-state checksums if needed"""
+    run_query(session, f"""
+    CREATE TABLE IF NOT EXISTS {state_table} (
+        source_table STRING,
+        target_table STRING,
+        validated_offset TIMESTAMP_TZ,
+        source_count NUMBER(38, 0),
+        target_count NUMBER(38, 0),
+        source_checksum NUMBER(38, 0),
+        target_checksum NUMBER(38, 0),
+        columns_hash STRING,
+        updated_at TIMESTAMP_LTZ
+    )
+    """)
+
+def get_columns_fingerprint(hash_str):
+    """Fingerprint the compared column expressions so stale checksums are detected"""
+    return hashlib.md5(hash_str.encode('utf-8')).hexdigest()
+
+def get_incremental_state(session, state_table, table1_full, table2_full):
+    """Get the last validated offset and base-state checksums of a table pair, or None"""
+    query = f"""
+    SELECT TO_VARCHAR(validated_offset, '{OFFSET_FORMAT}') as validated_offset,
+           source_count, target_count, source_checksum, target_checksum, columns_hash
+    FROM {state_table}
+    WHERE source_table = '{table1_full}' AND target_table = '{table2_full}'
+    """
+    rows = run_query(session, query)
+    if not rows:
+        return None
+    return {
+        'offset': rows[0]['VALIDATED_OFFSET'],
+        'source_count': int(rows[0]['SOURCE_COUNT']),
+        'target_count': int(rows[0]['TARGET_COUNT']),
+        'source_checksum': int(rows[0]['SOURCE_CHECKSUM']),
+        'target_checksum': int(rows[0]['TARGET_CHECKSUM']),
+        'columns_hash': rows[0]['COLUMNS_HASH']
+    }
+
+def save_incremental_state(session, state_table, table1_full, table2_full, state):
+    """Record a validated offset and the base-state checksums of a table pair"""
+    run_query(session, f"""
+    MERGE INTO {state_table} t
+    USING (
+        SELECT '{table1_full}' as source_table,
+               '{table2_full}' as target_table,
+               TO_TIMESTAMP_TZ('{state['offset']}', '{OFFSET_FORMAT}') as validated_offset,
+               {state['source_count']} as source_count,
+               {state['target_count']} as target_count,
+               {state['source_checksum']} as source_checksum,
+               {state['target_checksum']} as target_checksum,
+               '{state['columns_hash']}' as columns_hash
+    ) s
+    ON t.source_table = s.source_table AND t.target_table = s.target_table
+    WHEN MATCHED THEN UPDATE SET
+        validated_offset = s.validated_offset,
+        source_count = s.source_count,
+        target_count = s.target_count,
+        source_checksum = s.source_checksum,
+        target_checksum = s.target_checksum,
+        columns_hash = s.columns_hash,
+        updated_at = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT
+        (source_table, target_table, validated_offset, source_count, target_count,
+         source_checksum, target_checksum, columns_hash, updated_at)
+    VALUES
+        (s.source_table, s.target_table, s.validated_offset, s.source_count, s.target_count,
+         s.source_checksum, s.target_checksum, s.columns_hash, CURRENT_TIMESTAMP())
+    """)
+
+def get_current_offset(session):
+    """Get the current server timestamp formatted as an offset string"""
+    return run_query(session, f"SELECT TO_VARCHAR(CURRENT_TIMESTAMP(), '{OFFSET_FORMAT}') as ts")[0]['TS']
+
+def get_table_checksum_query(table_full, hash_str, offset):
+    """
+    Build the query getting the row count and additive checksum of a table as of an offset
+    SUM(HASH(...)) can be maintained from changes alone, unlike HASH_AGG
+    """
+    return f"""
+    SELECT COUNT(*) as row_count, COALESCE(SUM(HASH({hash_str})), 0) as checksum
+    FROM {table_full} AT(TIMESTAMP => TO_TIMESTAMP_TZ('{offset}', '{OFFSET_FORMAT}'))
+    """
+
+def get_changes_clause(start_offset, end_offset):
+    """Build the CHANGES clause selecting all row changes between two offsets"""
+    return f"""CHANGES(INFORMATION => DEFAULT)
+        AT(TIMESTAMP => TO_TIMESTAMP_TZ('{start_offset}', '{OFFSET_FORMAT}'))
+        END(TIMESTAMP => TO_TIMESTAMP_TZ('{end_offset}', '{OFFSET_FORMAT}'))"""
+
+def get_table_checksum_delta_query(table_full, hash_str, start_offset, end_offset):
+    """Build the query getting the row count and checksum change of a table between two offsets from its change log"""
+    return f"""
+    SELECT
+        COUNT(*) as changed_rows,
+        COUNT_IF(METADATA$ACTION = 'INSERT') - COUNT_IF(METADATA$ACTION = 'DELETE') as count_delta,
+        COALESCE(SUM(CASE WHEN METADATA$ACTION = 'INSERT' THEN HASH({hash_str})
+                          ELSE -HASH({hash_str}) END), 0) as checksum_delta
+    FROM {table_full} {get_changes_clause(start_offset, end_offset)}
+    """
+
+def is_change_tracking_on(session, database, schema, table_name):
+    """Check whether change tracking is enabled on a table"""
+    rows = run_query(session, f"SHOW TABLES LIKE '{table_name}' IN SCHEMA {database}.{schema}")
+    for row in rows:
+        # SHOW output column names may come back quoted and in either case
+        values = {key.strip('"').lower(): value for key, value in row.as_dict().items()}
+        if values.get('name') == table_name:
+            return values.get('change_tracking') == 'ON'
+    return False
+
+def ensure_change_tracking(session, db1, schema1, db2, schema2, table_name, enable_change_tracking=False):
+    """
+    Make sure change tracking is on for both tables of a pair
+    Tables are only altered when the user opted in; otherwise a table without it raises
+    """
+    for database, schema in ((db1, schema1), (db2, schema2)):
+        if is_change_tracking_on(session, database, schema, table_name):
+            continue
+        table_full = f"{database}.{schema}.{table_name}"
+        if not enable_change_tracking:
+            raise ValueError(f"Change tracking is off on {table_full}")
+        run_query(session, f"ALTER TABLE {table_full} SET CHANGE_TRACKING = TRUE")
+
+def establish_incremental_baseline(session, db1, schema1, db2, schema2, table_name, state_table, offset):
+    """
+    Query task: record the state of a table pair at an offset as the validated base state
+    The offset must be the one the full comparison ran at; checksums that disagree are refused
+    """
+    table1_full = f"{db1}.{schema1}.{table_name}"
+    table2_full = f"{db2}.{schema2}.{table_name}"
+
+    hash_str = get_hash_list(get_comparison_columns(session, db1, schema1, table_name))
+    source_rows, target_rows = yield plan_queries(
+        get_table_checksum_query(table1_full, hash_str, offset),
+        get_table_checksum_query(table2_full, hash_str, offset)
+    )
+    source_count, source_checksum = int(source_rows[0]['ROW_COUNT']), int(source_rows[0]['CHECKSUM'])
+    target_count, target_checksum = int(target_rows[0]['ROW_COUNT']), int(target_rows[0]['CHECKSUM'])
+    if source_count != target_count or source_checksum != target_checksum:
+        raise ValueError(f"Source and target checksums differ at {offset}")
+    save_incremental_state(session, state_table, table1_full, table2_full, {
+        'offset': offset,
+        'columns_hash': get_columns_fingerprint(hash_str),
+        'source_count': source_count,
+        'target_count': target_count,
+        'source_checksum': source_checksum,
+        'target_checksum': target_checksum
+    })
+
+def compare_table_data_incremental(session, db1, schema1, db2, schema2, table_name, state_table,
+                                   policy='AUTO', estimate_overlap=True,
+                                   cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES,
+                                   enable_change_tracking=False):
+    """
+    Query task: compare only the rows changed since the last validated offset of a table pair
+    Base-state checksums are rolled forward from the change log; if they still agree the pair
+    matches without a scan. Rows that can differ must have been inserted on one side or deleted
+    on the other since the offset, so only those candidates are diffed. Falls back to a full
+    comparison when there is no validated state, change tracking is off or the offset expired.
+    Change tracking is only switched on for tables when enable_change_tracking is set.
+    """
+    table1_full = f"{db1}.{schema1}.{table_name}"
+    table2_full = f"{db2}.{schema2}.{table_name}"
+    start_time = time.time()
+
+    try:
+        state = get_incremental_state(session, state_table, table1_full, table2_full)
+        columns = get_comparison_columns(session, db1, schema1, table_name)
+        columns_str = get_select_list(columns)
+        hash_str = get_hash_list(columns)
+    except Exception:
+        state = None
+
+    if state is not None and state['columns_hash'] != get_columns_fingerprint(hash_str):
+        # Checksums were taken over other column expressions (column rules changed)
+        state = None
+        fallback_reason = "Compared columns changed since the validated offset"
+    else:
+        fallback_reason = "No validated offset recorded yet"
+
+    if state is not None:
+        try:
+            start_offset = state['offset']
+            end_offset = get_current_offset(session)
+
+            delta1_rows, delta2_rows = yield plan_queries(
+                get_table_checksum_delta_query(table1_full, hash_str, start_offset, end_offset),
+                get_table_checksum_delta_query(table2_full, hash_str, start_offset, end_offset)
+            )
+            changed1, count_delta1, checksum_delta1 = (
+                int(delta1_rows[0][col]) for col in ('CHANGED_ROWS', 'COUNT_DELTA', 'CHECKSUM_DELTA')
+            )
+            changed2, count_delta2, checksum_delta2 = (
+                int(delta2_rows[0][col]) for col in ('CHANGED_ROWS', 'COUNT_DELTA', 'CHECKSUM_DELTA')
+            )
+            new_state = {
+                'offset': end_offset,
+                'columns_hash': state['columns_hash'],
+                'source_count': state['source_count'] + count_delta1,
+                'target_count': state['target_count'] + count_delta2,
+                'source_checksum': state['source_checksum'] + checksum_delta1,
+                'target_checksum': state['target_checksum'] + checksum_delta2
+            }
+            count1 = new_state['source_count']
+            count2 = new_state['target_count']
+
+            if count1 == count2 and new_state['source_checksum'] == new_state['target_checksum']:
+                diff1 = 0
+                diff2 = 0
+            else:
+                changes = get_changes_clause(start_offset, end_offset)
+                at_end = f"AT(TIMESTAMP => TO_TIMESTAMP_TZ('{end_offset}', '{OFFSET_FORMAT}'))"
+                diff_select = """
+                    (
+                        (SELECT {columns} FROM {this_table} {changes} WHERE METADATA$ACTION = 'INSERT'
+                         UNION
+                         SELECT {columns} FROM {other_table} {changes} WHERE METADATA$ACTION = 'DELETE')
+                        INTERSECT
+                        SELECT {columns} FROM {this_table} {at_end}
+                    )
+                    MINUS
+                    SELECT {columns} FROM {other_table} {at_end}
+                """
+                diff1_select = diff_select.format(columns=columns_str, this_table=table1_full, other_table=table2_full,
+                                                  changes=changes, at_end=at_end)
+                diff2_select = diff_select.format(columns=columns_str, this_table=table2_full, other_table=table1_full,
+                                                  changes=changes, at_end=at_end)
+                if cache_location:
+                    # The base state matched, so the changed candidates hold the whole diff
+                    entry = yield from materialize_table_diff(
+                        session, db1, schema1, db2, schema2, table_name, columns, cache_location, cache_ttl_minutes,
+                        end_offset, (diff1_select, diff2_select)
+                    )
+                    diff1, diff2 = yield from count_materialized_diff(entry)
+                else:
+                    diff1_rows, diff2_rows = yield plan_queries(
+                        f"SELECT COUNT(*) as diff_count FROM ({diff1_select})",
+                        f"SELECT COUNT(*) as diff_count FROM ({diff2_select})"
+                    )
+                    diff1 = diff1_rows[0]['DIFF_COUNT']
+                    diff2 = diff2_rows[0]['DIFF_COUNT']
+
+            tables_match = (diff1 == 0 and diff2 == 0 and count1 == count2)
+            checksums_match = new_state['source_checksum'] == new_state['target_checksum']
+
+            if tables_match and not checksums_match:
+                # No changed row differs, yet the base states do not add up: the recorded base
+                # state cannot be trusted, so the pair is re-validated with a full comparison
+                evict_diff_cache_entry(session, get_pair_key(db1, schema1, db2, schema2, table_name))
+                fallback_reason = "Rolled-forward checksums disagree although no changed row differs"
+            else:
+                if tables_match:
+                    save_incremental_state(session, state_table, table1_full, table2_full, new_state)
+
+                if count1 != count2:
+                    status = 'COUNT_MISMATCH'
+                else:
+                    status = 'MATCH' if tables_match else 'MISMATCH'
+
+                return {
+                    'source_schema': schema1,
+                    'target_schema': schema2,
+                    'table_name': table_name,
+                    'count1': count1,
+                    'count2': count2,
+                    'rows_in_table1_not_in_table2': diff1,
+                    'rows_in_table2_not_in_table1': diff2,
+                    'data_match': tables_match,
+                    'status': status,
+                    'strategy': STRATEGY_INCREMENTAL,
+                    'strategy_reason': f"{changed1 + changed2:,} changed row(s) since {start_offset}",
+                    'approximate': False,
+                    'elapsed_seconds': round(time.time() - start_time, 2)
+                }
+        except Exception as e:
+            if get_error_status(e) in ('TIMEOUT', 'CANCELLED'):
+                # A full re-scan would only run into the same limit
+                return build_status_result(schema1, schema2, table_name, get_error_status(e), str(e))
+            fallback_reason = f"Change tracking unavailable or offset expired ({str(e).splitlines()[0]})"
+
+    # Pin the offset first and compare as of it, so the recorded base state is exactly the one compared.
+    # Change tracking has to be on before the offset for later runs to read changes from it.
+    baseline_error = None
+    try:
+        ensure_change_tracking(session, db1, schema1, db2, schema2, table_name, enable_change_tracking)
+        offset = get_current_offset(session)
+    except Exception as e:
+        if get_error_status(e) in ('TIMEOUT', 'CANCELLED'):
+            return build_status_result(schema1, schema2, table_name, get_error_status(e), str(e))
+        offset = None
+        baseline_error = str(e).splitlines()[0]
+
+    result = yield from compare_table_data(
+        session, db1, schema1, db2, schema2, table_name, policy, estimate_overlap, cache_location, cache_ttl_minutes, offset
+    )
+    result['strategy_reason'] = f"{fallback_reason}; {result['strategy_reason']}"
+    if offset is not None and result['status'] == 'MATCH' and not result['approximate']:
+        try:
+            yield from establish_incremental_baseline(session, db1, schema1, db2, schema2, table_name, state_table, offset)
+        except Exception as e:
+            baseline_error = str(e).splitlines()[0]
+    if baseline_error is not None:
+        result['strategy_reason'] = f"{result['strategy_reason']}; base state not recorded: {baseline_error}"
+    return result
+
+def build_comparison_plan(db1, db2, table_pairs):
+    """
+    Compile a comparison request into a DAG of query tasks
+    table_pairs holds (schema1, schema2, table_name); '*' stands for every table of the source schema.
+    Lookups are keyed by what they read, so lookups shared by several tables collapse into one node,
+    and lookups of the same kind on the same database are merged into one batched query.
+    """
+    plan = nx.DiGraph(requested_lookups=0)
+    for schema1, schema2, table_name in table_pairs:
+        compare_task = ('compare', schema1, schema2, table_name)
+        plan.add_node(compare_task, kind='compare')
+        lookups = [(kind, db1, schema1) for kind in PLAN_LOOKUP_KINDS] + [('metadata', db2, schema2), ('keys', db2, schema2)]
+        for lookup in lookups:
+            plan.graph['requested_lookups'] += 1
+            plan.add_node(lookup, kind='lookup')
+            plan.add_edge(lookup, compare_task)
+
+    for lookup in [node for node, kind in plan.nodes(data='kind') if kind == 'lookup']:
+        lookup_kind, database, schema = lookup
+        batch = ('batch', lookup_kind, database)
+        if batch not in plan:
+            plan.add_node(batch, kind='batch', schemas=set())
+        plan.nodes[batch]['schemas'].add(schema)
+        plan.add_edge(batch, lookup)
+
+    return plan
+
+def plan_queries(*queries, result_type='row'):
+    """
+    Describe a group of independent queries for a query task to yield
+    The task gets their results back in the same order, or the first error raised at the yield
+    """
+    return [(query, result_type) for query in queries]
+
+def cancel_query_job(scheduler, job_key):
+    """Forget a scheduled query, cancelling it if it was already submitted"""
+    entry = scheduler['jobs'].pop(job_key)
+    if job_key in scheduler['queued']:
+        scheduler['queued'].remove(job_key)
+    if entry['job'] is not None:
+        try:
+            entry['job'].cancel()
+        except Exception:
+            pass
+        scheduler['inflight'].pop(entry['job'].query_id, None)
+
+def finish_query_task(scheduler, task, value):
+    """Record the return value (or exception) of a finished query task and free its query results"""
+    plan = scheduler['plan']
+    scheduler['running'].pop(task)
+    for node in plan.successors(task):
+        if plan.nodes[node]['kind'] == 'query':
+            plan.nodes[node].pop('result', None)
+    scheduler['values'][task] = value
+    if scheduler['on_finish'] is not None:
+        scheduler['on_finish'](task, value)
+
+def advance_query_task(scheduler, task, send_value=None, error=None):
+    """
+    Resume a query task until it waits on queries that are not answered yet, or finishes
+    Each query becomes a plan node under its task, so a query the task already ran is answered
+    from its node, and a query another task is running right now is shared instead of issued again
+    """
+    plan = scheduler['plan']
+    state = scheduler['running'][task]
+    control = st.session_state.get('run_control')
+    while True:
+        # Queries the task runs synchronously (run_query) share its deadline
+        if control is not None:
+            control['table_deadline'] = state['deadline']
+        try:
+            if error is not None:
+                group = state['generator'].throw(error)
+            else:
+                group = state['generator'].send(send_value)
+        except StopIteration as stop:
+            finish_query_task(scheduler, task, stop.value)
+            return
+        except Exception as e:
+            finish_query_task(scheduler, task, e)
+            return
+        finally:
+            if control is not None:
+                control['table_deadline'] = None
+
+        previous_nodes = state['nodes']
+        state['nodes'] = []
+        state['results'] = [None] * len(group)
+        state['missing'] = 0
+        state['error'] = None
+        for position, (query, result_type) in enumerate(group):
+            node = ('query', task, query, result_type)
+            state['nodes'].append(node)
+            if node in plan and 'result' in plan.nodes[node]:
+                state['results'][position] = plan.nodes[node]['result']
+                continue
+            plan.add_node(node, kind='query')
+            plan.add_edge(task, node)
+            for previous_node in previous_nodes:
+                if previous_node != node:
+                    plan.add_edge(previous_node, node)
+            state['missing'] += 1
+            job_key = (query, result_type)
+            # Another task running the same query right now shares its result
+            if job_key not in scheduler['jobs']:
+                scheduler['jobs'][job_key] = {'job': None, 'started': None, 'deadline': None, 'waiters': []}
+                scheduler['queued'].append(job_key)
+            scheduler['jobs'][job_key]['waiters'].append((task, position))
+
+        if state['missing']:
+            return
+        send_value = state['results']
+        error = None
+
+def finish_query_job(scheduler, job_key, value=None, error=None):
+    """Hand the result (or error) of a finished query to every task waiting on it"""
+    entry = scheduler['jobs'].pop(job_key)
+    if entry['job'] is not None:
+        scheduler['inflight'].pop(entry['job'].query_id, None)
+    for task, position in entry['waiters']:
+        state = scheduler['running'].get(task)
+        if state is None:
+            continue
+        if error is None:
+            state['results'][position] = value
+            scheduler['plan'].nodes[state['nodes'][position]]['result'] = value
+        elif state['error'] is None:
+            state['error'] = error
+        state['missing'] -= 1
+        if state['missing'] == 0:
+            advance_query_task(scheduler, task, state['results'], state['error'])
+
+def drop_query_task_waiters(scheduler, task):
+    """Detach a task from the queries it waits on, cancelling queries no other task waits on"""
+    for job_key, entry in list(scheduler['jobs'].items()):
+        entry['waiters'] = [waiter for waiter in entry['waiters'] if waiter[0] != task]
+        if not entry['waiters']:
+            cancel_query_job(scheduler, job_key)
+
+def execute_query_tasks(session, plan, tasks, on_start=None, on_finish=None, max_concurrency=PLAN_MAX_CONCURRENCY):
+    """
+    Run query tasks on the script thread with up to max_concurrency of their queries in flight
+    A query task is a generator yielding groups of independent queries (plan_queries). Queries are
+    submitted with collect_nowait and polled here, so they are registered like run_query's and the
+    heartbeat lets Stop interrupt the run; on the way out every query still running is cancelled.
+    tasks holds (plan node, generator) pairs, started in order as query slots free up.
+    on_start(task) returns the task's deadline; on_finish(task, value) gets what the task returned,
+    or the exception it raised. Returns {task: value}.
+    """
+    control = st.session_state.get('run_control')
+    scheduler = {
+        'plan': plan,
+        'running': {},
+        'jobs': {},
+        'queued': [],
+        'values': {},
+        'on_finish': on_finish,
+        'inflight': control['inflight'] if control is not None else {}
+    }
+    waiting = list(tasks)
+    try:
+        while waiting or scheduler['running']:
+            # Start tasks while there is room for more queries
+            while waiting and len(scheduler['jobs']) < max_concurrency:
+                task, generator = waiting.pop(0)
+                deadline = on_start(task) if on_start is not None else None
+                scheduler['running'][task] = {'generator': generator, 'deadline': deadline, 'nodes': []}
+                advance_query_task(scheduler, task)
+
+            # Submit queued queries up to the concurrency bound
+            submitted = [entry for entry in scheduler['jobs'].values() if entry['job'] is not None]
+            while scheduler['queued'] and len(submitted) < max_concurrency:
+                job_key = scheduler['queued'].pop(0)
+                entry = scheduler['jobs'][job_key]
+                try:
+                    entry['job'] = session.sql(job_key[0]).collect_nowait()
+                except Exception as e:
+                    finish_query_job(scheduler, job_key, error=e)
+                    continue
+                entry['started'] = time.time()
+                deadlines = [scheduler['running'][task]['deadline'] for task, _ in entry['waiters']]
+                if control is not None and control['query_timeout']:
+                    deadlines.append(entry['started'] + control['query_timeout'])
+                deadlines = [deadline for deadline in deadlines if deadline is not None]
+                entry['deadline'] = min(deadlines) if deadlines else None
+                scheduler['inflight'][entry['job'].query_id] = entry['started']
+                if control is not None:
+                    control['query_count'] += 1
+                submitted.append(entry)
+            if control is not None:
+                control['peak_concurrency'] = max(control['peak_concurrency'], len(submitted))
+
+            # Collect finished queries and time out the ones past their deadline
+            progressed = False
+            now = time.time()
+            for job_key, entry in list(scheduler['jobs'].items()):
+                if entry['job'] is None or scheduler['jobs'].get(job_key) is not entry:
+                    continue
+                if entry['job'].is_done():
+                    try:
+                        value = entry['job'].result(job_key[1])
+                        error = None
+                    except Exception as e:
+                        value = None
+                        error = e
+                    finish_query_job(scheduler, job_key, value, error)
+                    progressed = True
+                elif entry['deadline'] is not None and now > entry['deadline']:
+                    query_id = entry['job'].query_id
+                    try:
+                        entry['job'].cancel()
+                    except Exception:
+                        pass
+                    finish_query_job(scheduler, job_key, error=ComparisonTimeout(
+                        f"Query {query_id} passed its time limit after {now - entry['started']:.0f}s"
+                    ))
+                    progressed = True
+
+            # A task can pass its deadline while its queries still wait for a slot
+            for task in list(scheduler['running']):
+                state = scheduler['running'].get(task)
+                if state is not None and state['deadline'] is not None and now > state['deadline']:
+                    drop_query_task_waiters(scheduler, task)
+                    advance_query_task(scheduler, task, error=ComparisonTimeout("Table passed its time limit"))
+                    progressed = True
+
+            if control is not None:
+                # Updating an element lets Streamlit interrupt this run when Stop is clicked
+                running_jobs = [entry for entry in scheduler['jobs'].values() if entry['job'] is not None]
+                longest = max((now - entry['started'] for entry in running_jobs), default=0)
+                control['heartbeat'].caption(
+                    f"⏱️ {len(running_jobs)} quer{'y' if len(running_jobs) == 1 else 'ies'} running for "
+                    f"{len(scheduler['running'])} task(s), longest {longest:.0f}s"
+                )
+            if not progressed:
+                time.sleep(QUERY_POLL_SECONDS)
+    finally:
+        # Interrupted or failed: do not leave queries holding the warehouse
+        for job_key in list(scheduler['jobs']):
+            cancel_query_job(scheduler, job_key)
+        for state in scheduler['running'].values():
+            state['generator'].close()
+
+    return scheduler['values']
+
+def run_plan_batch(lookup_kind, database, schemas):
+    """Query task: one batched lookup covering every planned schema of a database"""
+    results = {(lookup_kind, database, schema): {} for schema in schemas}
+    schema_list = ", ".join(f"'{schema}'" for schema in sorted(schemas))
+
+    if lookup_kind == 'metadata':
+        rows, = yield plan_queries(f"""
+        SELECT TABLE_SCHEMA, TABLE_NAME, ROW_COUNT, BYTES, TABLE_TYPE
+        FROM {database}.INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA IN ({schema_list})
+        """)
+        for row in rows:
+            key = (lookup_kind, database, row['TABLE_SCHEMA'])
+            if key in results:
+                results[key][row['TABLE_NAME']] = {
+                    'row_count': row['ROW_COUNT'], 'bytes': row['BYTES'], 'table_type': row['TABLE_TYPE']
+                }
+    elif lookup_kind == 'columns':
+        rows, = yield plan_queries(f"""
+        SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME
+        FROM {database}.INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA IN ({schema_list})
+        ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION
+        """)
+        for row in rows:
+            key = (lookup_kind, database, row['TABLE_SCHEMA'])
+            if key in results:
+                results[key].setdefault(row['TABLE_NAME'], []).append(row['COLUMN_NAME'])
+    else:
+        keys_df, = yield plan_queries(f"SHOW PRIMARY KEYS IN DATABASE {database}", result_type='pandas')
+        # SHOW output column names may come back quoted and in either case
+        keys_df.columns = [col.strip('"').lower() for col in keys_df.columns]
+        if 'key_sequence' in keys_df.columns:
+            keys_df = keys_df.sort_values('key_sequence')
+        for _, row in keys_df.iterrows():
+            key = (lookup_kind, database, row['schema_name'])
+            if key in results:
+                results[key].setdefault(row['table_name'], []).append(row['column_name'])
+
+    return results
+
+def execute_plan_lookups(session, plan, max_concurrency=PLAN_MAX_CONCURRENCY):
+    """
+    Run the batched lookups of a plan as query tasks and keep their results for the run
+    A batch that fails is left out, so the tables it covers fall back to their own queries
+    """
+    control = st.session_state.get('run_control')
+    if control is None:
+        return
+    control['plan'] = plan
+
+    tasks = []
+    for batch in nx.topological_sort(plan):
+        if plan.nodes[batch]['kind'] == 'batch':
+            _, lookup_kind, database = batch
+            tasks.append((batch, run_plan_batch(lookup_kind, database, plan.nodes[batch]['schemas'])))
+
+    for results in execute_query_tasks(session, plan, tasks, max_concurrency=max_concurrency).values():
+        if not isinstance(results, Exception):
+            control['plan_cache'].update(results)
+
+def get_planned_tables(session, database, schema):
+    """Get the base tables of a schema, from the prefetched metadata when the plan has it"""
+    prefetched = get_plan_result('metadata', database, schema)
+    control = st.session_state.get('run_control')
+    if control is not None:
+        # The original sequence lists the tables of every source schema it compares
+        control['naive_queries'] += 1
+    if prefetched is None:
+        tables = get_all_tables_in_schema(session, database, schema)
+        return tables['TABLE_NAME'].tolist() if not tables.empty else []
+    return sorted(name for name, meta in prefetched.items() if meta['table_type'] == 'BASE TABLE')
+
+def expand_schema_task(plan, schema1, schema2, table_names):
+    """Replace the '*' compare task of a schema pair with one compare task per table"""
+    schema_task = ('compare', schema1, schema2, '*')
+    if schema_task not in plan:
+        # The same schema pair was requested twice and is already expanded
+        return
+    lookups = list(plan.predecessors(schema_task))
+    plan.remove_node(schema_task)
+    plan.graph['requested_lookups'] += len(lookups) * (len(table_names) - 1)
+    for table_name in table_names:
+        compare_task = ('compare', schema1, schema2, table_name)
+        plan.add_node(compare_task, kind='compare')
+        for lookup in lookups:
+            plan.add_edge(lookup, compare_task)
+
+def get_plan_compare_tasks(plan):
+    """Get the compare tasks of a plan in dependency order, keeping the requested table order"""
+    order = {node: position for position, node in enumerate(plan.nodes)}
+    return [
+        node
+        for generation in nx.topological_generations(plan)
+        for node in sorted(generation, key=order.get)
+        if plan.nodes[node]['kind'] == 'compare'
+    ]
+
+def compare_table_pair(session, db1, schema1, db2, schema2, table_name, policy='AUTO', estimate_overlap=True, state_table=None,
+                       cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES, enable_change_tracking=False):
+    """Query task: compare one table of a schema pair, reporting tables missing from the target as ONLY_IN_SOURCE"""
+    # Whatever strategy runs now, a diff materialized by an earlier comparison of the pair is stale
+    evict_diff_cache_entry(session, get_pair_key(db1, schema1, db2, schema2, table_name))
+
+    # Check if table exists in target schema
+    existence_status = None
+    target_tables = get_plan_result('metadata', db2, schema2)
+    if target_tables is not None:
+        table_exists_in_schema2 = table_name in target_tables
+    else:
+        try:
+            yield plan_queries(get_count_query(get_table_ref(db2, schema2, table_name)))
+            table_exists_in_schema2 = True
+        except Exception as e:
+            table_exists_in_schema2 = False
+            existence_status = get_error_status(e)
+            existence_error = str(e)
 
-        minus2_query = f"""
-        SELECT COUNT(*) as diff_count FROM (
-            SELECT {columns_str} FROM {table2_full}
-            MINUS
-            SELECT {columns_str} FROM {table1_full}
-        )
-        """
+    if existence_status in ('TIMEOUT', 'CANCELLED'):
+        # A check that timed out says nothing about whether the table exists
+        return build_status_result(schema1, schema2, table_name, existence_status, existence_error)
 
-        diff1 = session.sql(minus1_query).collect()[0]['DIFF_COUNT']
-        diff2 = session.sql(minus2_query).collect()[0]['DIFF_COUNT']
+    if table_exists_in_schema2:
+        # Both tables exist, compare data
+        if state_table:
+            return (yield from compare_table_data_incremental(
+                session, db1, schema1, db2, schema2, table_name, state_table,
+                policy, estimate_overlap, cache_location, cache_ttl_minutes, enable_change_tracking
+            ))
+        return (yield from compare_table_data(
+            session, db1, schema1, db2, schema2, table_name,
+            policy, estimate_overlap, cache_location, cache_ttl_minutes
+        ))
 
-        # Determine if tables match
-        tables_match = (diff1 == 0 and diff2 == 0 and count1 == count2)
+    # Table only exists in source schema
+    try:
+        count_rows, = yield plan_queries(get_count_query(get_table_ref(db1, schema1, table_name)))
+        count1 = count_rows[0]['COUNT']
+    except Exception:
+        count1 = 'ERROR'
+    return {
+        'source_schema': schema1,
+        'target_schema': schema2,
+        'table_name': table_name,
+        'count1': count1,
+        'count2': 'N/A',
+        'rows_in_table1_not_in_table2': 'N/A',
+        'rows_in_table2_not_in_table1': 'N/A',
+        'data_match': False,
+        'status': 'ONLY_IN_SOURCE'
+    }
 
-        return {
-            'source_schema': schema1,
-            'target_schema': schema2,
-            'table_name': table_name,
-            'count1': count1,
-            'count2': count2,
-            'rows_in_table1_not_in_table2': diff1,
-            'rows_in_table2_not_in_table1': diff2,
-            'data_match': tables_match,
-            'status': 'MATCH' if tables_match else 'MISMATCH'
-        }
+def prepare_comparison_run(session, state_table, cache_location):
+    """Create the incremental state table, load past timings and evict expired diffs before a run; False if the run cannot start"""
+    # Incremental mode keeps validated offsets in a state table
+    if state_table:
+        try:
+            ensure_incremental_state_table(session, state_table)
+        except Exception as e:
+            st.error(f"Error creating incremental state table {state_table}: {str(e)}")
+            return False
 
-    except Exception as e:
-        return {
-            'source_schema': schema1,
-            'target_schema': schema2,
-            'table_name': table_name,
-            'count1': 'ERROR',
-            'count2': 'ERROR',
-            'rows_in_table1_not_in_table2': 'ERROR',
-            'rows_in_table2_not_in_table1': 'ERROR',
-            'data_match': False,
-            'status': 'ERROR',
-            'error': str(e)
-        }
+    # A fresh session starts from the timings of earlier runs
+    load_strategy_timings(session)
 
-def run_selected_tables_comparison(session, db1, schema1, db2, schema2, selected_tables):
+    # Drop materialized diffs that outlived their TTL before creating new ones, including
+    # the ones left behind by sessions that ended
+    if cache_location:
+        evict_expired_diff_cache(session)
+        sweep_expired_diff_tables(session, cache_location)
+    return True
+
+def run_comparison_plan(session, db1, db2, plan, policy='AUTO', estimate_overlap=True, state_table=None,
+                        cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES,
+                        on_result=None, enable_change_tracking=False):
     """
-    Compare specific selected tables between two schemas
+    Run the compare tasks of a plan whose lookups have been executed
+    Each table is a query task, so queries of several tables run at once, up to PLAN_MAX_CONCURRENCY
+    on_result, if given, is called with each table result as soon as it is ready
     """
-    all_results = []
-    
-    if not selected_tables:
-        st.warning("No tables selected for comparison")
-        return pd.DataFrame()
-    
-    # Create progress tracking
-    total_tables = len(selected_tables)
-    current_table = 0
-    
+    results = {}
+    compare_tasks = get_plan_compare_tasks(plan)
+
+    control = st.session_state.get('run_control')
+    if control is not None:
+        control['pending'] = [(schema1, schema2, table_name) for _, schema1, schema2, table_name in compare_tasks]
+
     # Create progress containers
     progress_container = st.container()
     with progress_container:
         main_progress = st.progress(0)
         status_text = st.empty()
-    
-    # Compare each selected table
-    for table_name in selected_tables:
-        current_table += 1
-        main_progress.progress(current_table / total_tables)
-        status_text.text(f'Comparing table: {table_name} ({current_table}/{total_tables})')
-        
-        # Check if table exists in target schema
-        try:
-            count2_query = f"SELECT COUNT(*) as count FROM {db2}.{schema2}.{table_name}"
-            a = session.sql(count2_query).collect()[0]['COUNT']
-            table_exists_in_schema2 = True
-        except:
-            table_exists_in_schema2 = False
-        
-        if table_exists_in_schema2:
-            # Both tables exist, compare data
-            result = compare_table_data_minus(session, db1, schema1, db2, schema2, table_name)
-        else:
-            # Table only exists in source schema
-            try:
-                count1 = session.sql(f"SELECT COUNT(*) as count FROM {db1}.{schema1}.{table_name}").collect()[0]['COUNT']
-            except:
-                count1 = 'ERROR'
-            result = {
-                'source_schema': schema1,
-                'target_schema': schema2,
-                'table_name': table_name,
-                'count1': count1,
-                'count2': 'N/A',
-                'rows_in_table1_not_in_table2': 'N/A',
-                'rows_in_table2_not_in_table1': 'N/A',
-                'data_match': False,
-                'status': 'ONLY_IN_SOURCE'
-            }
-        
-        all_results.append(result)
-    
+
+    def start_table(task):
+        _, schema1, schema2, table_name = task
+        status_text.text(f'Comparing table: {table_name} ({len(results)}/{len(compare_tasks)} done)')
+        return mark_table_started(schema1, schema2, table_name)
+
+    def finish_table(task, result):
+        _, schema1, schema2, table_name = task
+        if isinstance(result, Exception):
+            result = build_status_result(schema1, schema2, table_name, get_error_status(result), str(result))
+        results[task] = result
+        mark_table_finished(result)
+        main_progress.progress(len(results) / len(compare_tasks))
+        if on_result is not None:
+            on_result(result)
+
+    tasks = [
+        (task, compare_table_pair(
+            session, db1, task[1], db2, task[2], task[3],
+            policy, estimate_overlap, state_table, cache_location, cache_ttl_minutes, enable_change_tracking
+        ))
+        for task in compare_tasks
+    ]
+    execute_query_tasks(session, plan, tasks, start_table, finish_table)
+    save_strategy_timings(session)
+
     # Clear progress tracking completely
     progress_container.empty()
-    
-    return pd.DataFrame(all_results)
-def run_multiple_schema_comparison(session, db1, schemas1_list, db2, schemas2_list):
+
+    # Tables finish in any order; report them in plan order
+    return pd.DataFrame([results[task] for task in compare_tasks if task in results])
+
+def run_selected_tables_comparison(session, db1, schema1, db2, schema2, selected_tables, policy='AUTO', estimate_overlap=True, state_table=None,
+                                   cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES,
+                                   on_result=None, enable_change_tracking=False):
+    """
+    Compare specific selected tables between two schemas
+    on_result, if given, is called with each table result as soon as it is ready
+    """
+    if not selected_tables:
+        st.warning("No tables selected for comparison")
+        return pd.DataFrame()
+
+    if not prepare_comparison_run(session, state_table, cache_location):
+        return pd.DataFrame()
+
+    control = st.session_state.get('run_control')
+    if control is not None:
+        control['pending'] = [(schema1, schema2, table_name) for table_name in selected_tables]
+
+    plan = build_comparison_plan(db1, db2, [(schema1, schema2, table_name) for table_name in selected_tables])
+    execute_plan_lookups(session, plan)
+
+    return run_comparison_plan(
+        session, db1, db2, plan, policy, estimate_overlap, state_table,
+        cache_location, cache_ttl_minutes, on_result, enable_change_tracking
+    )
+
+def run_multiple_schema_comparison(session, db1, schemas1_list, db2, schemas2_list, policy='AUTO', estimate_overlap=True, state_table=None,
+                                   cache_location=None, cache_ttl_minutes=DIFF_CACHE_TTL_MINUTES,
+                                   on_result=None, enable_change_tracking=False):
     """
     Compare tables across multiple schemas (one-to-one mapping)
+    on_result, if given, is called with each table result as soon as it is ready
     """
-    all_results = []
-    
     # Ensure both lists have the same length for one-to-one comparison
     if len(schemas1_list) != len(schemas2_list):
         st.error(f"Number of source schemas ({len(schemas1_list)}) must match number of target schemas ({len(schemas2_list)}) for one-to-one comparison")
         return pd.DataFrame()
-    
-    # Create progress tracking
-    total_comparisons = len(schemas1_list)
-    current_comparison = 0
-    
-    # Create progress containers
-    progress_container = st.container()
-    with progress_container:
-        main_progress = st.progress(0)
-        status_text = st.empty()
-    
-    # Compare schemas one-to-one
-    for i, (schema1, schema2) in enumerate(zip(schemas1_list, schemas2_list)):
-        schema1 = schema1.strip()
-        schema2 = schema2.strip()
-        current_comparison += 1
-        
-        main_progress.progress(current_comparison / total_comparisons)
-        #status_text.text(f'Comparing {schema1} with {schema2}')
-        
-        # Get tables from source schema
-        tables1 = get_all_tables_in_schema(session, db1, schema1)
-        
-        if tables1.empty:
+
+    if not prepare_comparison_run(session, state_table, cache_location):
+        return pd.DataFrame()
+
+    schema_pairs = [(schema1.strip(), schema2.strip()) for schema1, schema2 in zip(schemas1_list, schemas2_list)]
+
+    # Schema pairs whose tables are not listed yet are tracked as '*'
+    control = st.session_state.get('run_control')
+    if control is not None:
+        control['pending'] = [(schema1, schema2, '*') for schema1, schema2 in schema_pairs]
+
+    plan = build_comparison_plan(db1, db2, [(schema1, schema2, '*') for schema1, schema2 in schema_pairs])
+    execute_plan_lookups(session, plan)
+
+    # Tables are listed from the batched metadata, then each schema pair expands into its tables
+    for schema1, schema2 in dict.fromkeys(schema_pairs):
+        table_names = get_planned_tables(session, db1, schema1)
+        if not table_names:
             st.warning(f"No tables found in {db1}.{schema1}")
-            continue
-            
-        table_names = tables1['TABLE_NAME'].tolist()
-        schema_results = []
-        
-        # Process tables without showing individual table progress
-        for table_name in sorted(table_names):
-            
-            # Check if table exists in target schema
+        expand_schema_task(plan, schema1, schema2, table_names)
+
+    return run_comparison_plan(
+        session, db1, db2, plan, policy, estimate_overlap, state_table,
+        cache_location, cache_ttl_minutes, on_result, enable_change_tracking
+    )
+
+def get_table_diff_query(db1, schema1, db2, schema2, table_name, columns):
+    """
+    Build a query returning the rows that differ between two tables
+    Each row is tagged with the side it was found on in a DIFF_SIDE column
+    """
+    table1_full = f"{db1}.{schema1}.{table_name}"
+    table2_full = f"{db2}.{schema2}.{table_name}"
+    columns_str = get_select_list(columns)
+
+    return f"""
+    SELECT 'SOURCE_ONLY' as diff_side, * FROM (
+        SELECT {columns_str} FROM {table1_full}
+        MINUS
+        SELECT {columns_str} FROM {table2_full}
+    )
+    UNION ALL
+    SELECT 'TARGET_ONLY' as diff_side, * FROM (
+        SELECT {columns_str} FROM {table2_full}
+        MINUS
+        SELECT {columns_str} FROM {table1_full}
+    )
+    """
+
+def get_export_row(result):
+    """
+    Map one result onto EXPORT_RESULT_COLUMNS
+    Values that are not numbers ('N/A', 'ERROR', ...) in numeric columns move into notes
+    """
+    row = {}
+    notes = []
+    for col, dtype in EXPORT_RESULT_COLUMNS.items():
+        value = result.get(col)
+        if pd.isna(value):
+            value = None
+        elif dtype in ('Int64', 'Float64') and isinstance(value, str):
+            # Estimates are written as '~1,234'; the approximate column already flags them
+            number = value.lstrip('~').replace(',', '')
             try:
-                count2_query = f"SELECT COUNT(*) as count FROM {db2}.{schema2}.{table_name}"
-                a = session.sql(count2_query).collect()[0]['COUNT']
-                table_exists_in_schema2 = True
-            except:
-                table_exists_in_schema2 = False
-            
-            if table_exists_in_schema2:
-                # Both tables exist, compare data
-                result = compare_table_data_minus(session, db1, schema1, db2, schema2, table_name)
+                value = float(number) if dtype == 'Float64' else int(number)
+            except ValueError:
+                notes.append(f"{col}: {value}")
+                value = None
+        row[col] = value
+
+    for note_col in ('error', 'estimate_error'):
+        note = result.get(note_col)
+        if not pd.isna(note):
+            notes.append(f"{note_col}: {note}")
+    row['notes'] = '; '.join(notes) or None
+    return row
+
+def prepare_results_for_export(comparison_results):
+    """
+    Give the results frame the fixed EXPORT_RESULT_COLUMNS layout and types
+    The layout does not depend on which statuses or strategies a run produced
+    """
+    rows = [get_export_row(result) for result in comparison_results.to_dict('records')]
+    return pd.DataFrame(rows, columns=list(EXPORT_RESULT_COLUMNS)).astype(EXPORT_RESULT_COLUMNS)
+
+def results_to_file_bytes(comparison_results, file_format):
+    """Serialize the raw results frame for download"""
+    export_df = prepare_results_for_export(comparison_results)
+    if file_format == 'PARQUET':
+        buffer = io.BytesIO()
+        export_df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return export_df.to_csv(index=False).encode('utf-8')
+
+def get_file_format_clause(file_format):
+    """Build the FILE_FORMAT clause used when unloading to a stage"""
+    if file_format == 'CSV':
+        return "FILE_FORMAT = (TYPE = CSV COMPRESSION = GZIP FIELD_OPTIONALLY_ENCLOSED_BY = '\"')"
+    return "FILE_FORMAT = (TYPE = PARQUET)"
+
+def export_results_to_table(session, comparison_results, target_table):
+    """
+    Append the results frame to a Snowflake table using bulk loading
+    write_pandas stages the frame in chunks and loads it with COPY INTO
+    """
+    parts = target_table.split('.')
+    database = parts[-3] if len(parts) == 3 else None
+    schema = parts[-2] if len(parts) >= 2 else None
+    session.write_pandas(
+        prepare_results_for_export(comparison_results),
+        parts[-1],
+        database=database,
+        schema=schema,
+        auto_create_table=True,
+        chunk_size=EXPORT_BATCH_ROWS,
+        quote_identifiers=False
+    )
+    return len(comparison_results)
+
+def export_results_to_stage(session, comparison_results, stage_location, file_format):
+    """Unload the results frame to chunked files on a stage"""
+    results_sdf = session.create_dataframe(prepare_results_for_export(comparison_results))
+    results_sdf.write.copy_into_location(
+        f"{stage_location.rstrip('/')}/results/",
+        file_format_type=file_format.lower(),
+        header=True,
+        overwrite=True,
+        max_file_size=EXPORT_MAX_FILE_SIZE
+    )
+    return len(comparison_results)
+
+def get_diff_export_query(session, db1, schema1, db2, schema2, table_name):
+    """Get the diff rows query of a table pair, reading the materialized diff when one is cached"""
+    entry = get_cached_diff(db1, schema1, db2, schema2, table_name)
+    if entry is not None:
+        return f"""
+        SELECT 'SOURCE_ONLY' as diff_side, * FROM {entry['source_only_table']}
+        UNION ALL
+        SELECT 'TARGET_ONLY' as diff_side, * FROM {entry['target_only_table']}
+        """
+    columns = get_comparison_columns(session, db1, schema1, table_name)
+    return get_table_diff_query(db1, schema1, db2, schema2, table_name, columns)
+
+def export_table_diff_to_stage(session, db1, schema1, db2, schema2, table_name, stage_location, file_format):
+    """
+    Unload the differing rows of a table pair to chunked files on a stage
+    The diff is computed and written server-side, so no rows pass through the client
+    """
+    diff_query = get_diff_export_query(session, db1, schema1, db2, schema2, table_name)
+    copy_query = f"""
+    COPY INTO {stage_location.rstrip('/')}/diffs/{schema1}/{table_name}/
+    FROM ({diff_query})
+    {get_file_format_clause(file_format)}
+    HEADER = TRUE
+    MAX_FILE_SIZE = {EXPORT_MAX_FILE_SIZE}
+    OVERWRITE = TRUE
+    """
+    rows = session.sql(copy_query).collect()
+    return sum(row.as_dict().get('rows_unloaded', 0) for row in rows)
+
+def get_diff_table_name(target_location, schema1, table_name):
+    """Name the diff table of a table pair; the schema keeps same-named tables of different pairs apart"""
+    return f"{target_location}.{schema1}_{table_name}_DIFF"
+
+def export_table_diff_to_table(session, db1, schema1, db2, schema2, table_name, target_location):
+    """
+    Write the differing rows of a table pair into <target_location>.<schema1>_<table_name>_DIFF
+    Uses CREATE TABLE AS SELECT so the load happens entirely inside Snowflake
+    """
+    diff_query = get_diff_export_query(session, db1, schema1, db2, schema2, table_name)
+    diff_table = get_diff_table_name(target_location, schema1, table_name)
+    session.sql(f"CREATE OR REPLACE TABLE {diff_table} AS {diff_query}").collect()
+    return session.sql(f"SELECT COUNT(*) as count FROM {diff_table}").collect()[0]['COUNT']
+
+def run_export(session, saved_run, stage_location, file_format, results_table, diff_table_location, include_diffs):
+    """
+    Export a saved comparison run to a stage and/or Snowflake tables
+    Returns a list of (level, message) tuples for display
+    """
+    comparison_results = saved_run['results']
+    db1 = saved_run['db1']
+    db2 = saved_run['db2']
+    messages = []
+
+    if stage_location:
+        try:
+            count = export_results_to_stage(session, comparison_results, stage_location, file_format)
+            messages.append(('success', f"Unloaded {count} result row(s) to {stage_location}/results/"))
+        except Exception as e:
+            messages.append(('error', f"Error unloading results to {stage_location}: {str(e)}"))
+
+    if results_table:
+        try:
+            count = export_results_to_table(session, comparison_results, results_table)
+            messages.append(('success', f"Loaded {count} result row(s) into {results_table}"))
+        except Exception as e:
+            messages.append(('error', f"Error loading results into {results_table}: {str(e)}"))
+
+    if include_diffs:
+        mismatched = comparison_results[comparison_results['status'].isin(['MISMATCH', 'COUNT_MISMATCH'])]
+        for _, row in mismatched.iterrows():
+            schema1 = row['source_schema']
+            schema2 = row['target_schema']
+            table_name = row['table_name']
+            if stage_location:
+                try:
+                    count = export_table_diff_to_stage(session, db1, schema1, db2, schema2, table_name, stage_location, file_format)
+                    messages.append(('success', f"Unloaded {count} diff row(s) for {schema1}.{table_name}"))
+                except Exception as e:
+                    messages.append(('error', f"Error unloading diff rows for {schema1}.{table_name}: {str(e)}"))
+            if diff_table_location:
+                try:
+                    count = export_table_diff_to_table(session, db1, schema1, db2, schema2, table_name, diff_table_location)
+                    messages.append(('success', f"Wrote {count} diff row(s) to {get_diff_table_name(diff_table_location, schema1, table_name)}"))
+                except Exception as e:
+                    messages.append(('error', f"Error writing diff rows for {schema1}.{table_name}: {str(e)}"))
+
+    return messages
+
+def color_status(val):
+    """Color code the status column"""
+    if val == 'MATCH':
+        return 'background-color: #d4edda; color: #155724;'
+    elif val == 'SAMPLED_MATCH':
+        return 'background-color: #d1ecf1; color: #0c5460;'
+    elif val == 'MISMATCH':
+        return 'background-color: #f8d7da; color: #721c24;'
+    elif val == 'ONLY_IN_SOURCE':
+        return 'background-color: #fff3cd; color: #856404;'
+    elif val == 'COUNT_MISMATCH':
+        return 'background-color: #ffeaa7; color: #6c5ce7;'
+    elif val == 'ERROR':
+        return 'background-color: #f8d7da; color: #721c24;'
+    elif val in ('TIMEOUT', 'CANCELLED'):
+        return 'background-color: #e2e3e5; color: #383d41;'
+    return ''
+
+def create_live_results_view():
+    """
+    Create placeholders that show results while a comparison is running
+    The returned view is passed to append_live_result for every finished table
+    """
+    placeholder = st.empty()
+    with placeholder.container():
+        st.markdown("### ⏳ Live Results")
+        counters_col, only_in_source_col = st.columns([3, 2])
+        with counters_col:
+            counters = st.empty()
+        with only_in_source_col:
+            only_in_source = st.empty()
+        heartbeat = st.empty()
+        table = st.empty()
+    return {
+        'placeholder': placeholder,
+        'counters': counters,
+        'only_in_source': only_in_source,
+        'heartbeat': heartbeat,
+        'table': table,
+        'rows': [],
+        'only_in_source_tables': [],
+        'status_counts': {},
+        'last_refresh': 0.0
+    }
+
+def append_live_result(view, result):
+    """Add one table result to a live view, updating the counters incrementally"""
+    view['rows'].append(result)
+    status_counts = view['status_counts']
+    status_counts[result['status']] = status_counts.get(result['status'], 0) + 1
+
+    view['counters'].markdown(
+        f"**📊 Done:** {len(view['rows'])} &nbsp; "
+        f"**✅ Matches:** {status_counts.get('MATCH', 0)} &nbsp; "
+        f"**🔍 Sampled Matches:** {status_counts.get('SAMPLED_MATCH', 0)} &nbsp; "
+        f"**❌ Mismatches:** {status_counts.get('MISMATCH', 0) + status_counts.get('COUNT_MISMATCH', 0)} &nbsp; "
+        f"**⚠️ Only in Source:** {status_counts.get('ONLY_IN_SOURCE', 0)} &nbsp; "
+        f"**🛑 Errors:** {status_counts.get('ERROR', 0)} &nbsp; "
+        f"**⏱️ Timed Out / Cancelled:** {status_counts.get('TIMEOUT', 0) + status_counts.get('CANCELLED', 0)}"
+    )
+
+    # The Tables Only in Source list only changes when such a table comes in
+    if result['status'] == 'ONLY_IN_SOURCE':
+        view['only_in_source_tables'].append(f"{result['source_schema']}.{result['table_name']}")
+        view['only_in_source'].markdown(
+            "**⚠️ Tables Only in Source:**\n" +
+            "\n".join(f"- `{table_name}`" for table_name in view['only_in_source_tables'])
+        )
+
+    # Redrawing the table is the costly part, so it is throttled
+    now = time.time()
+    if now - view['last_refresh'] >= LIVE_REFRESH_SECONDS:
+        live_df = pd.DataFrame(view['rows'])
+        view['table'].dataframe(
+            live_df.style.map(color_status, subset=['status']),
+            use_container_width=True, height=290, hide_index=True
+        )
+        view['last_refresh'] = now
+
+def clean_column_rules(edited_rules):
+    """
+    Normalize rules coming from the editor and drop incomplete or invalid ones
+    Returns (rules, problems)
+    """
+    rules = []
+    problems = []
+    for rule in edited_rules:
+        rule = {key: ('' if pd.isna(value) else str(value).strip()) for key, value in rule.items()}
+        if not rule['column']:
+            continue
+        if rule['scope'] not in COLUMN_RULE_SCOPES or rule['action'] not in COLUMN_RULE_ACTIONS:
+            problems.append(f"Unknown scope or action in rule for {rule['column']}")
+            continue
+        if rule['scope'] != 'GLOBAL' and not rule['target']:
+            problems.append(f"{rule['scope']} rule for {rule['column']} needs a target")
+            continue
+        if rule['action'] == 'ROUND' and rule['argument'] and not rule['argument'].lstrip('-').isdigit():
+            problems.append(f"ROUND rule for {rule['column']} needs a whole number of decimals")
+            continue
+        try:
+            for pattern in (rule['column'], rule['target']):
+                if pattern.startswith('re:'):
+                    re.compile(pattern[3:])
+        except re.error as e:
+            problems.append(f"Invalid regex in rule for {rule['column']}: {str(e)}")
+            continue
+        rules.append(rule)
+    return rules, problems
+
+def render_column_rules_sidebar(session):
+    """Show the column rules editor and job configuration save/load in the sidebar"""
+    with st.sidebar:
+        st.markdown('<div class="nav-header">⚙️ COLUMN RULES</div>', unsafe_allow_html=True)
+        st.caption(
+            "Matching columns are excluded or normalized inside the comparison SQL. "
+            "Column and target patterns are globs (e.g. `*_LOADED_AT`) or regexes prefixed with `re:`. "
+            "Targets are `SCHEMA` or `SCHEMA.TABLE` patterns; table rules win over schema rules, "
+            "which win over global rules."
+        )
+
+        # The editor starts from the last loaded rules; its output becomes the active rules
+        rules_df = pd.DataFrame(
+            st.session_state.get('column_rules_base', []),
+            columns=['scope', 'target', 'column', 'action', 'argument']
+        )
+        edited_df = st.data_editor(
+            rules_df,
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'scope': st.column_config.SelectboxColumn("Scope", options=COLUMN_RULE_SCOPES, default='GLOBAL', required=True),
+                'target': st.column_config.TextColumn("Target"),
+                'column': st.column_config.TextColumn("Column", required=True),
+                'action': st.column_config.SelectboxColumn("Action", options=COLUMN_RULE_ACTIONS, default='EXCLUDE', required=True),
+                'argument': st.column_config.TextColumn("Argument", help="Decimals for ROUND (default 2)")
+            },
+            key=f"column_rules_editor_{st.session_state.get('column_rules_version', 0)}"
+        )
+        rules, problems = clean_column_rules(edited_df.to_dict('records'))
+        st.session_state['column_rules'] = rules
+        for problem in problems:
+            st.warning(f"⚠️ {problem}; rule ignored")
+
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+        st.markdown("### 💾 Job Configuration")
+        config_table = st.text_input(
+            "Config Table:",
+            placeholder="MY_DB.MY_SCHEMA.VALIDATION_JOBS",
+            help="Job configurations and the timings of past comparisons are stored here as JSON (created if missing)",
+            key="config_table"
+        ).strip()
+        config_name = st.text_input("Config Name:", key="config_name").strip()
+        col_save, col_load = st.columns(2)
+        with col_save:
+            save_clicked = st.button("💾 Save", key="config_save", use_container_width=True)
+        with col_load:
+            load_clicked = st.button("📂 Load", key="config_load", use_container_width=True)
+
+        loaded_config = None
+        if save_clicked or load_clicked:
+            if not (config_table and config_name):
+                st.error("⚠️ Please enter a config table and a config name")
+            elif save_clicked:
+                try:
+                    save_job_config(session, config_table, config_name, {'column_rules': rules})
+                    st.success(f"Saved configuration '{config_name}'")
+                except Exception as e:
+                    st.error(f"Error saving configuration: {str(e)}")
             else:
-                # Table only exists in source schema
                 try:
-                    count1 = session.sql(f"SELECT COUNT(*) as count FROM {db1}.{schema1}.{table_name}").collect()[0]['COUNT']
-                except:
-                    count1 = 'ERROR'
-                result = {
-                    'source_schema': schema1,
-                    'target_schema': schema2,
-                    'table_name': table_name,
-                    'count1': count1,
-                    'count2': 'N/A',
-                    'rows_in_table1_not_in_table2': 'N/A',
-                    'rows_in_table2_not_in_table1': 'N/A',
-                    'data_match': False,
-                    'status': 'ONLY_IN_SOURCE'
-                }
-            
-            schema_results.append(result)
-        
-        all_results.extend(schema_results)
-    
-    # Clear progress tracking completely
-    progress_container.empty()
-    
-    return pd.DataFrame(all_results)
+                    loaded_config = load_job_config(session, config_table, config_name)
+                    if loaded_config is None:
+                        st.warning(f"⚠️ No configuration named '{config_name}' in {config_table}")
+                except Exception as e:
+                    st.error(f"Error loading configuration: {str(e)}")
+
+        if loaded_config is not None:
+            # Start a fresh editor on the loaded rules
+            st.session_state['column_rules_base'] = loaded_config.get('column_rules', [])
+            st.session_state['column_rules_version'] = st.session_state.get('column_rules_version', 0) + 1
+            st.rerun()
+
+def render_plan_stats(saved_run):
+    """Show how many queries the query plan of the last comparison run saved"""
+    plan_stats = saved_run.get('plan_stats')
+    if not plan_stats:
+        return
+    st.caption(
+        f"🧮 **Query plan:** {plan_stats['requested_lookups']} per-table lookups deduped to "
+        f"{plan_stats['unique_lookups']} and batched into {plan_stats['batched_queries']} queries · "
+        f"{plan_stats['queries_issued']} queries issued vs {plan_stats['naive_queries']} in the original per-table sequence "
+        f"(**{plan_stats['queries_saved']} saved**) · {plan_stats['planned_queries']} compare queries planned, "
+        f"up to {plan_stats['peak_concurrency']} at once"
+    )
+
+def render_export_section(session, saved_run, key_prefix):
+    """Show download buttons and bulk export options for the last comparison run"""
+    comparison_results = saved_run['results']
+
+    with st.expander("📤 Export Results"):
+        file_format = st.selectbox("File Format:", EXPORT_FORMATS, key=f"{key_prefix}_export_format")
+
+        # Downloads use the raw results frame, not the styled view
+        st.download_button(
+            f"⬇️ Download Results ({file_format})",
+            data=results_to_file_bytes(comparison_results, file_format),
+            file_name=f"comparison_results.{'parquet' if file_format == 'PARQUET' else 'csv'}",
+            mime='application/octet-stream' if file_format == 'PARQUET' else 'text/csv',
+            key=f"{key_prefix}_download",
+            use_container_width=True
+        )
+
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+
+        stage_location = st.text_input(
+            "Stage Location:",
+            placeholder="@MY_DB.MY_SCHEMA.MY_STAGE/validation",
+            help="Results and diff rows are unloaded here as chunked files",
+            key=f"{key_prefix}_export_stage"
+        ).strip()
+        results_table = st.text_input(
+            "Results Table:",
+            placeholder="MY_DB.MY_SCHEMA.VALIDATION_RESULTS",
+            help="Results are appended to this table (created if missing)",
+            key=f"{key_prefix}_export_table"
+        ).strip()
+        include_diffs = st.checkbox(
+            "Include diff rows for mismatched tables",
+            key=f"{key_prefix}_export_diffs"
+        )
+        diff_table_location = ''
+        if include_diffs:
+            diff_table_location = st.text_input(
+                "Diff Tables Location:",
+                placeholder="MY_DB.MY_SCHEMA",
+                help="Diff rows for each table are written to <location>.<schema>_<table>_DIFF",
+                key=f"{key_prefix}_export_diff_location"
+            ).strip()
+
+        if st.button("📤 Export", key=f"{key_prefix}_export", use_container_width=True):
+            if not (stage_location or results_table or diff_table_location):
+                st.error("⚠️ Please enter a stage location or a target table to export to")
+            else:
+                with st.spinner("🔄 Exporting..."):
+                    messages = run_export(
+                        session, saved_run, stage_location, file_format,
+                        results_table, diff_table_location, include_diffs
+                    )
+                for level, message in messages:
+                    if level == 'success':
+                        st.success(message)
+                    else:
+                        st.error(message)
+
+def render_diff_rows_section(session, saved_run, key_prefix):
+    """Show paginated diff rows of mismatched tables from the materialized diff cache"""
+    comparison_results = saved_run['results']
+    db1 = saved_run['db1']
+    db2 = saved_run['db2']
+
+    evict_expired_diff_cache(session)
+    mismatched = comparison_results[comparison_results['status'] == 'MISMATCH']
+    cached_tables = {}
+    for _, row in mismatched.iterrows():
+        entry = get_cached_diff(db1, row['source_schema'], db2, row['target_schema'], row['table_name'])
+        if entry is not None:
+            cached_tables[f"{row['source_schema']}.{row['table_name']}"] = entry
+
+    if not cached_tables:
+        return
+
+    with st.expander("🔎 Diff Rows"):
+        selected = st.selectbox("Table:", list(cached_tables.keys()), key=f"{key_prefix}_diff_table")
+        side_label = st.radio(
+            "Rows:",
+            ["Only in source", "Only in target"],
+            horizontal=True,
+            key=f"{key_prefix}_diff_side"
+        )
+        page = st.number_input("Page:", min_value=1, value=1, step=1, key=f"{key_prefix}_diff_page")
+        side = 'SOURCE_ONLY' if side_label == "Only in source" else 'TARGET_ONLY'
+        try:
+            rows_df = get_diff_rows_page(session, cached_tables[selected], side, int(page) - 1)
+            st.dataframe(rows_df, use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.error(f"Error reading diff rows for {selected}: {str(e)}")
+
+        if st.button("🗑️ Drop Cached Diffs", key=f"{key_prefix}_diff_drop", use_container_width=True):
+            for _, row in mismatched.iterrows():
+                evict_diff_cache_entry(session, get_pair_key(db1, row['source_schema'], db2, row['target_schema'], row['table_name']))
+            st.success("Cached diffs dropped")
 # Streamlit UI
 st.set_page_config(page_title="Schema Data Comparison Tool", layout="wide", initial_sidebar_state="expanded")
 
@@ -516,7 +2753,6 @@ st.markdown("""
         margin: 1rem 0;
         border: 1px solid #495057;
         box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        display: none !important;
     }
     
     .download-header {
@@ -528,12 +2764,17 @@ st.markdown("""
     }
     
     /* Download button styling to match primary buttons */
-    .stDownloadButton {
-        display: none !important;
+    .stDownloadButton button {
+        font-size: 0.85rem !important;
+        padding: 0.4rem 1rem !important;
+        background-color: #212529 !important;
+        color: white !important;
+        border: 1px solid #212529 !important;
     }
     
-    .stDownloadButton button {
-        display: none !important;
+    .stDownloadButton button:hover {
+        background-color: #495057 !important;
+        border-color: #495057 !important;
     }
     
     
@@ -551,6 +2792,12 @@ st.markdown("""
 st.title("🔍 Snowflake Data Comparison Tool")
 st.markdown("<p style='text-align: center; color: #666; margin-bottom: 2rem;'>Compare tables between schemas with flexible selection options</p>", unsafe_allow_html=True)
 
+# A run still registered here was interrupted (Stop or any other widget) before it finished
+if finalize_stopped_run(session) is not None:
+    st.warning("⏹️ The last comparison was stopped; its in-flight queries were cancelled and unfinished tables are marked CANCELLED")
+
+render_column_rules_sidebar(session)
+
 # Create tabs for different comparison modes
 st.markdown("")
 st.markdown("")
@@ -619,8 +2866,80 @@ with tab1:
             
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
             
-            # Comparison button
+            # Comparison policy
+            policy_label = st.selectbox(
+                "Comparison Policy:",
+                list(COMPARISON_POLICIES.keys()),
+                help="Auto picks the cheapest sufficient strategy per table and never samples unless sampling is chosen",
+                key="comparison_policy"
+            )
+            estimate_overlap = st.checkbox(
+                "Estimate overlap for count mismatches",
+                value=True,
+                help="Adds one HyperLogLog scan per side; estimates are prefixed with ~, or shown as ≤ N when within the HLL error",
+                key="estimate_overlap"
+            )
+            incremental_mode = st.checkbox(
+                "Incremental mode",
+                help="Compare only rows changed since the last validated run, using Snowflake change tracking",
+                key="incremental_mode"
+            )
+            state_table = ''
+            if incremental_mode:
+                state_table = st.text_input(
+                    "State Table:",
+                    placeholder="MY_DB.MY_SCHEMA.VALIDATION_STATE",
+                    help="Validated offsets and base-state checksums are stored here (created if missing)",
+                    key="state_table"
+                ).strip()
+                enable_change_tracking = st.checkbox(
+                    "Enable change tracking on compared tables",
+                    help="Runs ALTER TABLE ... SET CHANGE_TRACKING = TRUE on source and target tables that do not have it yet",
+                    key="enable_change_tracking"
+                )
+            materialize_diffs = st.checkbox(
+                "Materialize diffs",
+                help="Store each MINUS direction once so row views and exports reuse it (sampled comparisons are not stored)",
+                key="materialize_diffs"
+            )
+            cache_location = ''
+            cache_ttl_minutes = DIFF_CACHE_TTL_MINUTES
+            if materialize_diffs:
+                cache_location = st.text_input(
+                    "Diff Cache Location:",
+                    placeholder="MY_DB.MY_SCHEMA",
+                    help="Transient diff tables are created here and dropped after the TTL",
+                    key="cache_location"
+                ).strip()
+                cache_ttl_minutes = st.number_input(
+                    "Cache TTL (minutes):",
+                    min_value=1,
+                    value=DIFF_CACHE_TTL_MINUTES,
+                    key="cache_ttl_minutes"
+                )
+            
+            # Time limits
+            col_query_timeout, col_table_timeout = st.columns(2)
+            with col_query_timeout:
+                query_timeout = st.number_input(
+                    "Query Timeout (s):",
+                    min_value=0,
+                    value=DEFAULT_QUERY_TIMEOUT_SECONDS,
+                    help="Cancel any single query running longer than this (0 = no limit)",
+                    key="query_timeout"
+                )
+            with col_table_timeout:
+                table_timeout = st.number_input(
+                    "Table Timeout (s):",
+                    min_value=0,
+                    value=DEFAULT_TABLE_TIMEOUT_SECONDS,
+                    help="Give up on a table after this long in total (0 = no limit)",
+                    key="table_timeout"
+                )
+            
+            # Comparison buttons; Stop reruns the app, which cancels the in-flight queries
             compare_clicked = st.button("🚀 Compare Selected Tables", type="primary", key="compare_selected", use_container_width=True)
+            st.button("⏹️ Stop", key="stop", use_container_width=True)
             
             st.markdown('</div></div>', unsafe_allow_html=True)
     
@@ -641,66 +2960,75 @@ with tab1:
                     - **Table Name:** `{selected_tables}`
                     """)
                     
+                    live_view = create_live_results_view()
+                    start_run_control(session, 'selected_tables_run', db1, db2, live_view['heartbeat'], query_timeout, table_timeout)
                     with st.spinner("🔄 Comparing selected tables..."):
                         comparison_results = run_selected_tables_comparison(
-                            session, db1, schema1, db2, schema2, selected_tables
+                            session, db1, schema1, db2, schema2, selected_tables,
+                            COMPARISON_POLICIES[policy_label], estimate_overlap,
+                            state_table if incremental_mode else None,
+                            cache_location if materialize_diffs else None, cache_ttl_minutes,
+                            lambda result: append_live_result(live_view, result),
+                            enable_change_tracking=incremental_mode and enable_change_tracking
                         )
-                        
-                        if not comparison_results.empty:
-                            # Color code the status column
-                            def color_status(val):
-                                if val == 'MATCH':
-                                    return 'background-color: #d4edda; color: #155724;'
-                                elif val == 'MISMATCH':
-                                    return 'background-color: #f8d7da; color: #721c24;'
-                                elif val == 'ONLY_IN_SOURCE':
-                                    return 'background-color: #fff3cd; color: #856404;'
-                                elif val == 'COUNT_MISMATCH':
-                                    return 'background-color: #ffeaa7; color: #6c5ce7;'
-                                elif val == 'ERROR':
-                                    return 'background-color: #f8d7da; color: #721c24;'
-                                return ''
-                            
-                            styled_df = comparison_results.style.map(color_status, subset=['status'])
-                            st.dataframe(styled_df, use_container_width=True, height=290, hide_index=True)
-                            
-                            # Summary statistics with enhanced styling
-                            status_counts = comparison_results['status'].value_counts()
-                            st.markdown("### 📈 Summary Statistics")
-                            
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                st.markdown("""
-                                <div class="metric-container">
-                                    <div style="font-size: 0.8rem; color: #666;">📊 Total Tables</div>
-                                    <div style="font-size: 1 rem; font-weight: bold; color: #212529;">{}</div>
-                                </div>
-                                """.format(len(comparison_results)), unsafe_allow_html=True)
-                            with col2:
-                                st.markdown("""
-                                <div class="metric-container">
-                                    <div style="font-size: 0.8rem; color: #666;">✅ Matches</div>
-                                    <div style="font-size: 1 rem; font-weight: bold; color: #28a745;">{}</div>
-                                </div>
-                                """.format(status_counts.get('MATCH', 0)), unsafe_allow_html=True)
-                            with col3:
-                                st.markdown("""
-                                <div class="metric-container">
-                                    <div style="font-size: 0.8rem; color: #666;">❌ Mismatches</div>
-                                    <div style="font-size: 1 rem; font-weight: bold; color: #dc3545;">{}</div>
-                                </div>
-                                """.format(status_counts.get('MISMATCH', 0) + status_counts.get('COUNT_MISMATCH', 0)), unsafe_allow_html=True)
-                            
-                            # Show tables that only exist in source
-                            only_in_source_df = comparison_results[comparison_results['status'] == 'ONLY_IN_SOURCE']
-                            if not only_in_source_df.empty:
-                                st.markdown("### ⚠️ Tables Only in Source Schema")
-                                st.dataframe(only_in_source_df, use_container_width=True, hide_index=True)
-                        else:
-                            st.error("❌ No comparison results generated")
+                    control = end_run_control(session)
+                    live_view['placeholder'].empty()
+                    st.session_state['selected_tables_run'] = {
+                        'results': comparison_results, 'db1': db1, 'db2': db2,
+                        'status_counts': live_view['status_counts'],
+                        'plan_stats': get_plan_stats(control)
+                    }
                 else:
                     st.error("⚠️ Please select databases, schemas, and at least one table to compare")
-            else:
+            
+            # Show the last comparison results; they are kept across reruns so they can be exported
+            saved_run = st.session_state.get('selected_tables_run')
+            if saved_run is not None:
+                comparison_results = saved_run['results']
+                if not comparison_results.empty:
+                    styled_df = comparison_results.style.map(color_status, subset=['status'])
+                    st.dataframe(styled_df, use_container_width=True, height=290, hide_index=True)
+                    
+                    # Summary statistics, counted incrementally while the run progressed
+                    status_counts = saved_run['status_counts']
+                    st.markdown("### 📈 Summary Statistics")
+                    
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">📊 Total Tables</div>
+                            <div style="font-size: 1 rem; font-weight: bold; color: #212529;">{}</div>
+                        </div>
+                        """.format(len(comparison_results)), unsafe_allow_html=True)
+                    with col2:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">✅ Matches</div>
+                            <div style="font-size: 1 rem; font-weight: bold; color: #28a745;">{}</div>
+                        </div>
+                        """.format(status_counts.get('MATCH', 0)), unsafe_allow_html=True)
+                    with col3:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">❌ Mismatches</div>
+                            <div style="font-size: 1 rem; font-weight: bold; color: #dc3545;">{}</div>
+                        </div>
+                        """.format(status_counts.get('MISMATCH', 0) + status_counts.get('COUNT_MISMATCH', 0)), unsafe_allow_html=True)
+                    
+                    render_plan_stats(saved_run)
+                    
+                    # Show tables that only exist in source
+                    only_in_source_df = comparison_results[comparison_results['status'] == 'ONLY_IN_SOURCE']
+                    if not only_in_source_df.empty:
+                        st.markdown("### ⚠️ Tables Only in Source Schema")
+                        st.dataframe(only_in_source_df, use_container_width=True, hide_index=True)
+                    
+                    render_export_section(session, saved_run, 'selected')
+                    render_diff_rows_section(session, saved_run, 'selected')
+                else:
+                    st.error("❌ No comparison results generated")
+            elif not compare_clicked:
                 st.info("👈 **Get Started:** Configure your comparison settings and click 'Compare Selected Tables' to see results here.")
             
             st.markdown('</div>', unsafe_allow_html=True)
@@ -760,8 +3088,80 @@ with tab2:
             
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
             
-            # Comparison button
+            # Comparison policy
+            policy_label_multi = st.selectbox(
+                "Comparison Policy:",
+                list(COMPARISON_POLICIES.keys()),
+                help="Auto picks the cheapest sufficient strategy per table and never samples unless sampling is chosen",
+                key="comparison_policy_multi"
+            )
+            estimate_overlap_multi = st.checkbox(
+                "Estimate overlap for count mismatches",
+                value=True,
+                help="Adds one HyperLogLog scan per side; estimates are prefixed with ~, or shown as ≤ N when within the HLL error",
+                key="estimate_overlap_multi"
+            )
+            incremental_mode_multi = st.checkbox(
+                "Incremental mode",
+                help="Compare only rows changed since the last validated run, using Snowflake change tracking",
+                key="incremental_mode_multi"
+            )
+            state_table_multi = ''
+            if incremental_mode_multi:
+                state_table_multi = st.text_input(
+                    "State Table:",
+                    placeholder="MY_DB.MY_SCHEMA.VALIDATION_STATE",
+                    help="Validated offsets and base-state checksums are stored here (created if missing)",
+                    key="state_table_multi"
+                ).strip()
+                enable_change_tracking_multi = st.checkbox(
+                    "Enable change tracking on compared tables",
+                    help="Runs ALTER TABLE ... SET CHANGE_TRACKING = TRUE on source and target tables that do not have it yet",
+                    key="enable_change_tracking_multi"
+                )
+            materialize_diffs_multi = st.checkbox(
+                "Materialize diffs",
+                help="Store each MINUS direction once so row views and exports reuse it (sampled comparisons are not stored)",
+                key="materialize_diffs_multi"
+            )
+            cache_location_multi = ''
+            cache_ttl_minutes_multi = DIFF_CACHE_TTL_MINUTES
+            if materialize_diffs_multi:
+                cache_location_multi = st.text_input(
+                    "Diff Cache Location:",
+                    placeholder="MY_DB.MY_SCHEMA",
+                    help="Transient diff tables are created here and dropped after the TTL",
+                    key="cache_location_multi"
+                ).strip()
+                cache_ttl_minutes_multi = st.number_input(
+                    "Cache TTL (minutes):",
+                    min_value=1,
+                    value=DIFF_CACHE_TTL_MINUTES,
+                    key="cache_ttl_minutes_multi"
+                )
+            
+            # Time limits
+            col_query_timeout_multi, col_table_timeout_multi = st.columns(2)
+            with col_query_timeout_multi:
+                query_timeout_multi = st.number_input(
+                    "Query Timeout (s):",
+                    min_value=0,
+                    value=DEFAULT_QUERY_TIMEOUT_SECONDS,
+                    help="Cancel any single query running longer than this (0 = no limit)",
+                    key="query_timeout_multi"
+                )
+            with col_table_timeout_multi:
+                table_timeout_multi = st.number_input(
+                    "Table Timeout (s):",
+                    min_value=0,
+                    value=DEFAULT_TABLE_TIMEOUT_SECONDS,
+                    help="Give up on a table after this long in total (0 = no limit)",
+                    key="table_timeout_multi"
+                )
+            
+            # Comparison buttons; Stop reruns the app, which cancels the in-flight queries
             compare_multiple_clicked = st.button("🚀 Compare Multiple Schemas", type="primary", key="compare_multiple", use_container_width=True)
+            st.button("⏹️ Stop", key="stop_multi", use_container_width=True)
             
             st.markdown('</div></div>', unsafe_allow_html=True)
     
@@ -787,73 +3187,85 @@ with tab2:
                         for i, (s1, s2) in enumerate(zip(selected_schemas1, selected_schemas2), 1):
                             st.write(f"**Pair {i}:** `{s1}` ↔ `{s2}`")
                         
+                        live_view = create_live_results_view()
+                        start_run_control(
+                            session, 'multiple_schema_run', db1_multi, db2_multi, live_view['heartbeat'],
+                            query_timeout_multi, table_timeout_multi
+                        )
                         with st.spinner():
                             comparison_results = run_multiple_schema_comparison(
-                                session, db1_multi, selected_schemas1, db2_multi, selected_schemas2
+                                session, db1_multi, selected_schemas1, db2_multi, selected_schemas2,
+                                COMPARISON_POLICIES[policy_label_multi], estimate_overlap_multi,
+                                state_table_multi if incremental_mode_multi else None,
+                                cache_location_multi if materialize_diffs_multi else None, cache_ttl_minutes_multi,
+                                lambda result: append_live_result(live_view, result),
+                                enable_change_tracking=incremental_mode_multi and enable_change_tracking_multi
                             )
-                            
-                            if not comparison_results.empty:
-                                # Color code the status column
-                                def color_status(val):
-                                    if val == 'MATCH':
-                                        return 'background-color: #d4edda; color: #155724;'
-                                    elif val == 'MISMATCH':
-                                        return 'background-color: #f8d7da; color: #721c24;'
-                                    elif val == 'ONLY_IN_SOURCE':
-                                        return 'background-color: #fff3cd; color: #856404;'
-                                    elif val == 'COUNT_MISMATCH':
-                                        return 'background-color: #ffeaa7; color: #6c5ce7;'
-                                    elif val == 'ERROR':
-                                        return 'background-color: #f8d7da; color: #721c24;'
-                                    return ''
-                                
-                                styled_df = comparison_results.style.map(color_status, subset=['status'])
-                                st.dataframe(styled_df, use_container_width=True, height=290, hide_index=True)
-                                
-                                # Summary statistics with enhanced styling
-                                status_counts = comparison_results['status'].value_counts()
-                                st.markdown("### 📈 Summary Statistics")
-                                
-                                col1, col2, col3, col4 = st.columns(4)
-                                with col1:
-                                    st.markdown("""
-                                    <div class="metric-container">
-                                        <div style="font-size: 0.8rem; color: #666;">📊 Total Tables</div>
-                                        <div style="font-size: 1.5rem; font-weight: bold; color: #212529;">{}</div>
-                                    </div>
-                                    """.format(len(comparison_results)), unsafe_allow_html=True)
-                                with col2:
-                                    st.markdown("""
-                                    <div class="metric-container">
-                                        <div style="font-size: 0.8rem; color: #666;">✅ Matches</div>
-                                        <div style="font-size: 1.5rem; font-weight: bold; color: #28a745;">{}</div>
-                                    </div>
-                                    """.format(status_counts.get('MATCH', 0)), unsafe_allow_html=True)
-                                with col3:
-                                    st.markdown("""
-                                    <div class="metric-container">
-                                        <div style="font-size: 0.8rem; color: #666;">❌ Mismatches</div>
-                                        <div style="font-size: 1.5rem; font-weight: bold; color: #dc3545;">{}</div>
-                                    </div>
-                                    """.format(status_counts.get('MISMATCH', 0) + status_counts.get('COUNT_MISMATCH', 0)), unsafe_allow_html=True)
-                                with col4:
-                                    st.markdown("""
-                                    <div class="metric-container">
-                                        <div style="font-size: 0.8rem; color: #666;">⚠️ Only in Source</div>
-                                        <div style="font-size: 1.5rem; font-weight: bold; color: #ffc107;">{}</div>
-                                    </div>
-                                    """.format(status_counts.get('ONLY_IN_SOURCE', 0)), unsafe_allow_html=True)
-                                
-                                # Show tables that only exist in source
-                                only_in_source_df = comparison_results[comparison_results['status'] == 'ONLY_IN_SOURCE']
-                                if not only_in_source_df.empty:
-                                    st.markdown("### ⚠️ Tables Only in Source Schema(s)")
-                                    st.dataframe(only_in_source_df, use_container_width=True, hide_index=True)
-                            else:
-                                st.error("❌ No comparison results generated")
+                        control = end_run_control(session)
+                        live_view['placeholder'].empty()
+                        st.session_state['multiple_schema_run'] = {
+                            'results': comparison_results, 'db1': db1_multi, 'db2': db2_multi,
+                            'status_counts': live_view['status_counts'],
+                            'plan_stats': get_plan_stats(control)
+                        }
                 else:
                     st.error("⚠️ Please select databases and schemas for comparison")
-            else:
+            
+            # Show the last comparison results; they are kept across reruns so they can be exported
+            saved_run = st.session_state.get('multiple_schema_run')
+            if saved_run is not None:
+                comparison_results = saved_run['results']
+                if not comparison_results.empty:
+                    styled_df = comparison_results.style.map(color_status, subset=['status'])
+                    st.dataframe(styled_df, use_container_width=True, height=290, hide_index=True)
+                    
+                    # Summary statistics, counted incrementally while the run progressed
+                    status_counts = saved_run['status_counts']
+                    st.markdown("### 📈 Summary Statistics")
+                    
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">📊 Total Tables</div>
+                            <div style="font-size: 1.5rem; font-weight: bold; color: #212529;">{}</div>
+                        </div>
+                        """.format(len(comparison_results)), unsafe_allow_html=True)
+                    with col2:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">✅ Matches</div>
+                            <div style="font-size: 1.5rem; font-weight: bold; color: #28a745;">{}</div>
+                        </div>
+                        """.format(status_counts.get('MATCH', 0)), unsafe_allow_html=True)
+                    with col3:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">❌ Mismatches</div>
+                            <div style="font-size: 1.5rem; font-weight: bold; color: #dc3545;">{}</div>
+                        </div>
+                        """.format(status_counts.get('MISMATCH', 0) + status_counts.get('COUNT_MISMATCH', 0)), unsafe_allow_html=True)
+                    with col4:
+                        st.markdown("""
+                        <div class="metric-container">
+                            <div style="font-size: 0.8rem; color: #666;">⚠️ Only in Source</div>
+                            <div style="font-size: 1.5rem; font-weight: bold; color: #ffc107;">{}</div>
+                        </div>
+                        """.format(status_counts.get('ONLY_IN_SOURCE', 0)), unsafe_allow_html=True)
+                    
+                    render_plan_stats(saved_run)
+                    
+                    # Show tables that only exist in source
+                    only_in_source_df = comparison_results[comparison_results['status'] == 'ONLY_IN_SOURCE']
+                    if not only_in_source_df.empty:
+                        st.markdown("### ⚠️ Tables Only in Source Schema(s)")
+                        st.dataframe(only_in_source_df, use_container_width=True, hide_index=True)
+                    
+                    render_export_section(session, saved_run, 'multiple')
+                    render_diff_rows_section(session, saved_run, 'multiple')
+                else:
+                    st.error("❌ No comparison results generated")
+            elif not compare_multiple_clicked:
                 st.info("👈 **Get Started:** Configure your comparison settings and click 'Compare Multiple Schemas' to see results here.")
             
             st.markdown('</div>', unsafe_allow_html=True)